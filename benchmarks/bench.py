@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+benchmarks for gnome-layout-switcher
+
+fake gsettings, gnome-extensions, pacman, lspci, busctl ... are put first in PATH,
+they only record their call and wait --latency seconds, so a spawned process costs the same on all machines.
+Each benchmark runs in a new python process with an empty HOME and the gsettings memory backend.
+
+    python3 benchmarks/bench.py [--latency 0.005] [--runs 5] [--output results.json] [name ...]
+
+Result is JSON: median time, processes spawned by python (audit hooks) and calls of fake programs.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+STUBS = (
+    "gsettings", "gnome-extensions", "pacman", "lspci", "busctl",
+    "pkexec", "dconf", "pgrep", "gnome-session-quit", "curl",
+)
+STUB_SCRIPT = """#!/bin/sh
+echo "$(basename "$0") $*" >> "$GLS_BENCH_LOG"
+sleep "$GLS_BENCH_LATENCY"
+"""
+
+# run in child, {setup} is not timed
+HARNESS = """
+import json, sys, time
+spawns = 0
+def audit(event, args):
+    global spawns
+    if event in ("subprocess.Popen", "os.posix_spawn", "os.system", "os.exec", "os.fork"):
+        spawns += 1
+sys.addaudithook(audit)
+{setup}
+start = time.perf_counter()
+{body}
+print(json.dumps({{"seconds": time.perf_counter() - start, "spawns": spawns}}))
+"""
+
+GTK_SETUP = """
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk
+"""
+
+LAYOUTS = ("traditional", "manjaro", "material_shell", "gnome")
+
+# name -> (setup, body, needs a display)
+BENCHMARKS = {
+    "import-cli": ("", "import layoutswitcherlib.cli", False),
+    "import-gui": ("", "import layoutswitcherlib.layoutsbox", False),
+    "layoutbox": (GTK_SETUP + "from layoutswitcherlib.layoutsbox import LayoutBox\nwin = Gtk.Window()",
+                  "box = LayoutBox(win)", True),
+    "set-preview-colors": (GTK_SETUP + "from layoutswitcherlib.layoutsbox import LayoutBox\n"
+                           "box = LayoutBox(Gtk.Window())",
+                           "box.set_preview_colors('#ff0000')", True),
+    "render-previews": ("from layoutswitcherlib.layouts import load_layouts, data_dir\n"
+                        "from layoutswitcherlib.previews import PreviewRenderer\n"
+                        "layouts = load_layouts()\n"
+                        "renderer = PreviewRenderer({key: data_dir() / 'pictures' / layout.preview "
+                        "for key, layout in layouts.items()})",
+                        "for key in layouts:\n"
+                        "    renderer.render(key, '#ffffff')\n"
+                        "    renderer.render(key, '#16a085')", False),
+    "render-previews-warm": ("from layoutswitcherlib.layouts import load_layouts, data_dir\n"
+                             "from layoutswitcherlib.previews import PreviewRenderer, ThumbnailCache\n"
+                             "layouts = load_layouts()\n"
+                             "templates = {key: data_dir() / 'pictures' / layout.preview "
+                             "for key, layout in layouts.items()}\n"
+                             "renderer = PreviewRenderer(templates, thumbnails=ThumbnailCache())\n"
+                             "for key in layouts:\n"
+                             "    renderer.render(key, '#ffffff')\n"
+                             "    renderer.render(key, '#16a085')\n"
+                             "renderer = PreviewRenderer(templates, thumbnails=ThumbnailCache())",
+                             "for key in layouts:\n"
+                             "    renderer.render(key, '#ffffff')\n"
+                             "    renderer.render(key, '#16a085')", False),
+}
+for _layout in LAYOUTS:
+    BENCHMARKS[f"apply-{_layout}"] = ("from layoutswitcherlib.layouts import apply_layout",
+                                      f"apply_layout('{_layout}')", False)
+    BENCHMARKS[f"reapply-{_layout}"] = (f"from layoutswitcherlib.layouts import apply_layout\n"
+                                        f"apply_layout('{_layout}')",
+                                        f"apply_layout('{_layout}')", False)
+
+
+def make_stubs(directory: Path):
+    for name in STUBS:
+        stub = directory / name
+        stub.write_text(STUB_SCRIPT)
+        stub.chmod(0o755)
+
+
+def display_prefix() -> list:
+    """ command prefix to get a display, None if not possible """
+    if os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"):
+        return []
+    if shutil.which("xvfb-run"):
+        return ["xvfb-run", "-a"]
+    return None
+
+
+def run_benchmark(name: str, runs: int, latency: float, workdir: Path) -> dict:
+    setup, body, needs_display = BENCHMARKS[name]
+    prefix = display_prefix() if needs_display else []
+    if prefix is None:
+        return {"name": name, "skipped": "no display and no xvfb-run"}
+
+    stubs_dir = workdir / "stubs"
+    log = workdir / "calls.log"
+    env = dict(os.environ)
+    env.update({
+        "PATH": f"{stubs_dir}:{env.get('PATH', '')}",
+        "PYTHONPATH": str(ROOT / "bin"),
+        "GLS_BENCH_LOG": str(log),
+        "GLS_BENCH_LATENCY": str(latency),
+        "GSETTINGS_BACKEND": "memory",
+        "DBUS_SESSION_BUS_ADDRESS": "disabled:",
+        "HOME": str(workdir / "home"),
+        "XDG_CACHE_HOME": str(workdir / "home/.cache"),
+        "XDG_CONFIG_HOME": str(workdir / "home/.config"),
+    })
+    code = HARNESS.format(setup=setup, body=body)
+
+    times = []
+    result = {"name": name}
+    for _ in range(runs):
+        shutil.rmtree(workdir / "home", ignore_errors=True)
+        (workdir / "home").mkdir()
+        log.write_text("")
+        process = subprocess.run(prefix + [sys.executable, "-c", code], env=env, capture_output=True, text=True)
+        try:
+            measure = json.loads(process.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            errors = process.stderr.strip().splitlines()
+            return {"name": name, "error": errors[-1] if errors else f"exit {process.returncode}"}
+        times.append(measure["seconds"])
+        calls = log.read_text().splitlines()
+        result.update({"spawns": measure["spawns"], "stub_calls": len(calls), "calls": calls})
+    result.update({
+        "seconds": statistics.median(times),
+        "min": min(times),
+        "max": max(times),
+        "runs": runs,
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gnome-layout-switcher benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run, default all: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds for each fake program")
+    parser.add_argument("--output", help="JSON file, default stdout")
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(prefix="gls-bench-") as tmp:
+        workdir = Path(tmp)
+        (workdir / "stubs").mkdir()
+        make_stubs(workdir / "stubs")
+        results = [run_benchmark(name, args.runs, args.latency, workdir) for name in args.names or BENCHMARKS]
+
+    report = json.dumps({
+        "python": sys.version.split()[0],
+        "latency": args.latency,
+        "benchmarks": results,
+    }, indent=2)
+    if args.output:
+        Path(args.output).write_text(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+checks of code changing the system, run against temporary directories only
+
+root helper on a temporary root, package plan with a fake pacman and its database,
+dconf compiler on a temporary prefix. Nothing is written outside the temporary directory.
+
+    python3 benchmarks/checks.py [name ...]
+
+Result is JSON, exit code is 1 if a check failed.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "bin"))
+
+# fake pacman: "--root DIR" then -Qq, -S or -R with package names, database in DIR/var/lib/pacman/local,
+# a package named "broken-*" fails
+PACMAN_SCRIPT = """#!{python}
+import glob, os, shutil, sys
+arguments = sys.argv[1:]
+db = os.path.join(arguments[1], "var/lib/pacman/local")
+action = arguments[2]
+names = [name for name in arguments[3:] if not name.startswith("-")]
+if action == "-Qq":
+    for name in names:
+        if glob.glob(os.path.join(db, glob.escape(name) + "-*-*")):
+            print(name)
+    sys.exit(0)
+if any(name.startswith("broken-") for name in names):
+    sys.exit("error: target not found: broken")
+print("installing" if action == "-S" else "removing", *names)
+for name in names:
+    if action == "-S":
+        os.makedirs(os.path.join(db, name + "-1.0-1"), exist_ok=True)
+    else:
+        for path in glob.glob(os.path.join(db, glob.escape(name) + "-*-*")):
+            shutil.rmtree(path)
+"""
+
+
+def fake_pacman(tmp: Path):
+    """ fake pacman first in PATH """
+    stubs = tmp / "stubs"
+    stubs.mkdir()
+    pacman = stubs / "pacman"
+    pacman.write_text(PACMAN_SCRIPT.format(python=sys.executable))
+    pacman.chmod(0o755)
+    os.environ["PATH"] = f"{stubs}:{os.environ['PATH']}"
+
+
+def temp_helper(root: Path):
+    """ helper on a temporary root, in process when running as root (helper refuses --root) """
+    from layoutswitcherlib.privileged import PrivilegedHelper, run_operation
+
+    helper = PrivilegedHelper(elevate=(), root=root)
+    if os.geteuid() == 0:
+        def run():
+            operations, helper.operations = helper.operations, []
+            results = [run_operation(root, operation) for operation in operations]
+            return {"ok": all(result["ok"] for result in results), "results": results}
+        helper.run = run
+    return helper
+
+
+def check_privileged(tmp: Path):
+    from layoutswitcherlib.privileged import read_wayland, run_operation
+
+    fake_pacman(tmp)
+    root = tmp / "root"
+    conf = root / "etc/gdm/custom.conf"
+    conf.parent.mkdir(parents=True)
+    conf.write_text("[daemon]\n#WaylandEnable=false\n\n[security]\n")
+    assert read_wayland(root)
+
+    # one batch: wayland and both package transactions
+    helper = temp_helper(root)
+    helper.set_wayland(False).install(["new-ext"]).remove(["new-ext"])
+    helper.operations += [{"op": "set-wayland", "enabled": "no"}, {"op": "install", "packages": ["Bad Name"]},
+                          {"op": "reboot"}]
+    report = helper.run()
+    assert not report["ok"], report
+    results = report["results"]
+    assert results[0] == {"op": "set-wayland", "ok": True, "error": None, "state": {"wayland": False}}, results[0]
+    assert results[1]["ok"] and results[1]["state"] == {"packages": {"new-ext": True}}, results[1]
+    assert results[2]["ok"] and results[2]["state"] == {"packages": {"new-ext": False}}, results[2]
+    assert not any(result["ok"] for result in results[3:]), results
+    assert "WaylandEnable=false" in conf.read_text().splitlines()
+    assert "[security]" in conf.read_text()
+
+    assert run_operation(root, {"op": "set-wayland", "enabled": True})["state"] == {"wayland": True}
+    assert "#WaylandEnable=false" in conf.read_text().splitlines()
+    empty = tmp / "empty"
+    assert run_operation(empty, {"op": "set-wayland", "enabled": False})["state"] == {"wayland": False}
+
+
+def check_packages(tmp: Path):
+    from layoutswitcherlib.packages import PackageIndex, PackagePlan
+
+    fake_pacman(tmp)
+    root = tmp / "root"
+    db = root / "var/lib/pacman/local"
+    for entry in ("gnome-shell-44.2-1", "old-ext-2-1", "lib32-foo-bar-1.0-3"):
+        (db / entry).mkdir(parents=True)
+    index = PackageIndex(db)
+    assert index.installed() == {"gnome-shell", "old-ext", "lib32-foo-bar"}, index.installed()
+
+    plan = PackagePlan(index)
+    plan.add_remove(["new-ext", "old-ext", "absent", "gnome-shell"])
+    plan.add_install(["gnome-shell", "new-ext", "new-ext", "other-ext"])
+    plan.add_remove(["new-ext", "old-ext", "gnome-shell"])
+    assert plan.install == ["new-ext", "other-ext"], plan.install
+    # installed and asked to install: kept, even if asked to remove before or after
+    assert plan.remove == ["old-ext"], plan.remove
+
+    helper = plan.queue(temp_helper(root))
+    assert helper.operations == [{"op": "install", "packages": ["new-ext", "other-ext"]},
+                                 {"op": "remove", "packages": ["old-ext"]}], helper.operations
+    with open(tmp / "stdout", "w+") as stdout:
+        # pacman output must not mix with a JSON report on stdout
+        saved = os.dup(1)
+        os.dup2(stdout.fileno(), 1)
+        try:
+            results = plan.results(helper.run())
+        finally:
+            os.dup2(saved, 1)
+            os.close(saved)
+        stdout.seek(0)
+        assert stdout.read() == "", "pacman wrote on stdout"
+    assert all(result["ok"] for result in results.values()), results
+    assert index.installed() == {"gnome-shell", "new-ext", "other-ext", "lib32-foo-bar"}, index.installed()
+
+    plan = PackagePlan(index)
+    plan.add_install(["broken-ext"])
+    assert plan.run(temp_helper(root)) == {"broken-ext": {"action": "install", "ok": False}}
+    assert PackagePlan(index).is_empty()
+
+
+def check_dconfdb(tmp: Path):
+    from layoutswitcherlib.dconfdb import KEYFILE_NAME, compile_layout, layout_keyfile
+    from layoutswitcherlib.layouts import load_layouts
+
+    layouts = load_layouts()
+    for layout in layouts.values():
+        # an untyped empty array is refused by "dconf update"
+        values = [value for keys in layout_keyfile(layout).values() for value in keys.values()]
+        assert not [value for value in values if value.strip() in ("[]", "{}")], (layout.id, values)
+    empty = [layout for layout in layouts.values() if not layout.required]
+    if empty:
+        assert layout_keyfile(empty[0])["org/gnome/shell"]["enabled-extensions"] == "@as []"
+
+    prefix = tmp / "image"
+    db_dir = prefix / "etc/dconf/db/gnome-layout-switcher.d"
+    first, second = list(layouts.values())[:2]
+
+    ok, written, error = compile_layout(first, prefix, lock=True, profile=True, update=False)
+    assert ok, error
+    assert (db_dir / KEYFILE_NAME).exists() and (db_dir / "locks" / KEYFILE_NAME).exists(), written
+    profile = (prefix / "etc/dconf/profile/user").read_text().splitlines()
+    assert profile == ["user-db:user", "system-db:gnome-layout-switcher"], profile
+
+    # files of an older version under another name are replaced, others are kept
+    (db_dir / f"00-{first.id}").write_text("# generated by gnome-layout-switcher\n")
+    (db_dir / "10-admin").write_text("[org/gnome/desktop/interface]\nclock-format='24h'\n")
+    ok, written, error = compile_layout(second, prefix, profile=True, update=False)
+    assert ok, error
+    assert sorted(path.name for path in db_dir.iterdir()) == [KEYFILE_NAME, "10-admin", "locks"]
+    assert not (db_dir / "locks" / KEYFILE_NAME).exists()
+    assert (prefix / "etc/dconf/profile/user").read_text().splitlines() == profile
+
+    (prefix / "etc/dconf/db").chmod(0o500)
+    try:
+        if os.geteuid() != 0:
+            ok, written, error = compile_layout(first, prefix, db_name="other", update=False)
+            assert not ok and error and written == [], (ok, written, error)
+    finally:
+        (prefix / "etc/dconf/db").chmod(0o700)
+
+
+CHECKS = {
+    "privileged": check_privileged,
+    "packages": check_packages,
+    "dconfdb": check_dconfdb,
+}
+
+
+def run_check(name: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix=f"gls-check-{name}-") as tmp:
+        try:
+            # stdout is only the JSON report
+            with contextlib.redirect_stdout(sys.stderr):
+                CHECKS[name](Path(tmp))
+        except ImportError as err:
+            return {"name": name, "skipped": str(err)}
+        except Exception:
+            return {"name": name, "ok": False, "error": traceback.format_exc().strip().splitlines()[-3:]}
+    return {"name": name, "ok": True}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gnome-layout-switcher checks")
+    parser.add_argument("names", nargs="*", help=f"checks to run, default all: {', '.join(CHECKS)}")
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(CHECKS)
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(sorted(unknown))}")
+
+    results = [run_check(name) for name in args.names or CHECKS]
+    print(json.dumps({"python": sys.version.split()[0], "checks": results}, indent=2))
+    if not all(result.get("ok", True) for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
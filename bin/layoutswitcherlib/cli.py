@@ -0,0 +1,87 @@
+import contextlib
+import json
+import sys
+import click
+from pathlib import Path
+from .dconfdb import DEFAULT_DB_NAME, compile_layout
+from .layouts import apply_layout, load_layouts, undo_layout
+from .manifest import ManifestError, read_manifest, plan_manifest, run_steps
+from .system import get_layouts, enable_wayland, disable_wayland
+
+
+def layout_command(layout):
+    """ create "apply-<layout>" command from layout definition """
+    @click.command(name=f"apply-{layout.id.replace('_', '-')}", help=f"Apply {layout.label} layout")
+    def command():
+        good, err = apply_layout(layout.id)
+        if not good:
+            click.echo(err, err=True)
+            sys.exit(1)
+    return command
+
+
+@click.group(epilog="--trace FILE writes a Chrome trace (JSON) of spawned processes.")
+def cli():
+    pass
+
+
+@cli.command(name="enable-wayland", help="Enable wayland")
+def enable_wayland_command():
+    enable_wayland()
+
+
+@cli.command(name="disable-wayland", help="Disable wayland")
+def disable_wayland_command():
+    disable_wayland()
+
+
+@cli.command(help="Restore desktop settings saved before the last layout apply")
+def undo():
+    good, err = undo_layout()
+    if not good:
+        click.echo(err, err=True)
+        sys.exit(1)
+
+
+@cli.command(help="Apply a layout, extensions, wayland and highlight color from a manifest")
+@click.option("--manifest", "manifest_file", required=True, type=click.Path(exists=True, dir_okay=False),
+              help="TOML file")
+@click.option("--dry-run", is_flag=True, help="Print the plan, change nothing")
+def apply(manifest_file, dry_run):
+    try:
+        # stdout is only the JSON report, messages of planning go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            steps = plan_manifest(read_manifest(manifest_file))
+    except ManifestError as err:
+        click.echo(json.dumps({"ok": False, "error": str(err)}, indent=2))
+        sys.exit(2)
+    if dry_run:
+        report = {"ok": True, "dry-run": True, "steps": [{"step": step.name, "detail": step.detail} for step in steps]}
+    else:
+        report = run_steps(steps)
+    click.echo(json.dumps(report, indent=2))
+    if not report["ok"]:
+        sys.exit(1)
+
+
+@cli.command(name="compile-dconf", help="Write a layout as system dconf database, for all new users")
+@click.argument("layout")
+@click.option("--prefix", default="/", type=click.Path(file_okay=False), help="Root directory, for image builds")
+@click.option("--name", "db_name", default=DEFAULT_DB_NAME, help="Database name in /etc/dconf/db/")
+@click.option("--lock", is_flag=True, help="Lock keys, users can't change them")
+@click.option("--profile", is_flag=True, help="Add database to /etc/dconf/profile/user")
+@click.option("--no-update", is_flag=True, help="Don't run \"dconf update\"")
+def compile_dconf(layout, prefix, db_name, lock, profile, no_update):
+    layouts = load_layouts()
+    if layout not in layouts:
+        raise click.BadParameter(f"use one of: {', '.join(layouts)}", param_hint="LAYOUT")
+    ok, written, error = compile_layout(layouts[layout], Path(prefix), db_name, lock, profile, not no_update)
+    for file_name in written:
+        click.echo(file_name)
+    if not ok:
+        click.echo(f"Error: {error}", err=True)
+        sys.exit(1)
+
+
+for _layout in get_layouts():
+    cli.add_command(layout_command(_layout))
@@ -1,10 +1,117 @@
+import atexit
 import configparser
+import fcntl
+import os
+import threading
 from pathlib import Path
 
+SAVE_DELAY = 0.5  # seconds, writes in this delay are saved together
+
+
+class ConfFile:
+    """
+    one .conf file shared by all UserConf of the process
+
+    file is re-read only if its mtime changed, values not yet saved are kept
+    """
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.lock = threading.RLock()
+        self.config = configparser.ConfigParser()
+        self.mtime = None
+        self.pending = {}  # (section, key) -> value not yet on disk
+        self.timer = None
+
+    def stat(self):
+        try:
+            return os.stat(self.file_name).st_mtime_ns
+        except OSError:
+            return None
+
+    def read(self) -> configparser.ConfigParser:
+        """ file content with pending values """
+        config = configparser.ConfigParser()
+        config.read(self.file_name)
+        for (section, key), value in self.pending.items():
+            if not config.has_section(section):
+                config.add_section(section)
+            config[section][key] = value
+        return config
+
+    def refresh(self):
+        mtime = self.stat()
+        if mtime != self.mtime or mtime is None:
+            self.config = self.read()
+            self.mtime = mtime
+
+    def set(self, section: str, key: str, value: str):
+        self.pending[(section, key)] = value
+        if not self.config.has_section(section):
+            self.config.add_section(section)
+        self.config[section][key] = value
+
+    def schedule(self):
+        """ save after SAVE_DELAY, restarted by each new write """
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+            self.timer = threading.Timer(SAVE_DELAY, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        """
+        write pending values now
+
+        file is read again under an fcntl lock, so values written by another process are kept,
+        then written in a temp file, synced and renamed
+        """
+
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending:
+                return
+            Path(self.file_name).parent.mkdir(parents=True, exist_ok=True)
+            with open(f"{self.file_name}.lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                config = self.read()
+                tmp_file = f"{self.file_name}.{os.getpid()}.tmp"
+                with open(tmp_file, "wt") as configfile:
+                    config.write(configfile)
+                    configfile.flush()
+                    os.fsync(configfile.fileno())
+                os.replace(tmp_file, self.file_name)
+            self.config = config
+            self.mtime = self.stat()
+            self.pending.clear()
+
+
+_conf_files = {}  # file name -> ConfFile
+_conf_files_lock = threading.Lock()
+
+
+def get_conf_file(file_name: str) -> ConfFile:
+    with _conf_files_lock:
+        if file_name not in _conf_files:
+            _conf_files[file_name] = ConfFile(file_name)
+        return _conf_files[file_name]
+
+
+@atexit.register
+def flush_all():
+    """ save pending writes before exit """
+    for conf_file in list(_conf_files.values()):
+        conf_file.flush()
+
 
 class UserConf:
     """
     class for read/write key-values in $HOME
+
+    all objects of the process share one cached file, see ConfFile
     """
     KEY = 'SETTING'
     __app_name__ = "gnome-layout-switcher"
@@ -22,6 +129,7 @@ class UserConf:
         self.inifile = f"{Path.home()}/.config/{app_name}.conf"
         # self.inifile.parent.mkdir(parents=True, exist_ok=True)
         self.config = None  # can use only after "with"
+        self.file = None
         self.modified = False
 
     def __enter__(self) -> object:
@@ -29,24 +137,28 @@ class UserConf:
         enter in "with" ...
         """
 
-        self.config = configparser.ConfigParser()
-        self.config.read(self.inifile)
+        self.file = get_conf_file(self.inifile)
+        self.file.lock.acquire()
+        self.file.refresh()
+        self.config = self.file.config
         self.modified = False
         # create default session "KEY" if not exists
-        try:
-            self.config[self.KEY]
-        except KeyError:
-            self.config[self.KEY] = {}
+        if not self.config.has_section(self.KEY):
+            self.config.add_section(self.KEY)
 
         return self
 
     def __exit__(self, etype, evalue, traceback) -> None:
-        self.save()
+        try:
+            self.save()
+        finally:
+            self.file.lock.release()
 
     def save(self):
+        """ debounced, file is written later by ConfFile """
         if self.modified:
-            with open(self.inifile, 'wt') as configfile:
-                self.config.write(configfile)
+            self.file.schedule()
+            self.modified = False
 
     def read(self, key: str, default=None):
         """
@@ -85,14 +197,8 @@ class UserConf:
         if not section:
             section = self.KEY
         section = section.upper()
-        section_object = None
-        try:
-            section_object = self.config[section]
-        except KeyError:
-            self.config[section] = {}
-
         for key, local_val in fields.items():
-            section_object[key] = str(local_val)
+            self.file.set(section, self.config.optionxform(key), str(local_val))
         self.modified = True
 
 
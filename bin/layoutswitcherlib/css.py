@@ -0,0 +1,112 @@
+import os
+from pathlib import Path
+
+DEFINE = b"@define-color"
+
+
+def comment_spans(content: bytes) -> list:
+    """ (start, end) of each /* */ comment, an unclosed comment ends with the file """
+    spans = []
+    start = content.find(b"/*")
+    while start != -1:
+        end = content.find(b"*/", start + 2)
+        end = len(content) if end == -1 else end + 2
+        spans.append((start, end))
+        start = content.find(b"/*", end)
+    return spans
+
+
+def parse_defines(content: bytes) -> dict:
+    """
+    index @define-color lines, without regex, defines in comments are skipped
+
+    Returns:
+        dict: name -> (start, end) byte span of the color value
+    """
+
+    index = {}
+    comments = comment_spans(content)
+    position = content.find(DEFINE)
+    while position != -1:
+        while comments and comments[0][1] <= position:
+            comments.pop(0)
+        in_comment = comments and comments[0][0] <= position
+        line_start = content.rfind(b"\n", 0, position) + 1
+        end = content.find(b";", position)
+        newline = content.find(b"\n", position)
+        if (not in_comment and content[line_start:position].strip() == b"" and end != -1
+                and (newline == -1 or end < newline)):
+            rest = content[position + len(DEFINE):end]
+            parts = rest.split(None, 1)
+            if len(parts) == 2:
+                # spans from offsets, the value text can also be in the name
+                name_end = position + len(DEFINE) + len(rest) - len(rest.lstrip()) + len(parts[0])
+                tail = content[name_end:end]
+                start = name_end + len(tail) - len(tail.lstrip())
+                index[parts[0].decode()] = (start, start + len(tail.strip()))
+        position = content.find(DEFINE, position + len(DEFINE))
+    return index
+
+
+class CssDefines:
+    """
+    @define-color of a css file
+
+    index is built once and kept while file mtime is the same,
+    set() replace only the value span and write file atomically
+    """
+
+    def __init__(self, file_name: Path, template=None):
+        """
+        Args:
+            file_name (Path): css file
+            template (callable): return default content if file not exists
+        """
+
+        self.file_name = Path(file_name)
+        self.template = template
+        self.token = None
+        self.content = b""
+        self.index = {}
+
+    def refresh(self):
+        try:
+            stat = os.stat(self.file_name)
+        except OSError:
+            self.token, self.content, self.index = None, b"", {}
+            return
+        token = (stat.st_mtime_ns, stat.st_size)
+        if token != self.token:
+            self.content = self.file_name.read_bytes()
+            self.index = parse_defines(self.content)
+            self.token = token
+
+    def get(self, name: str, default=None):
+        self.refresh()
+        if name not in self.index:
+            return default
+        start, end = self.index[name]
+        return self.content[start:end].decode()
+
+    def set(self, name: str, value: str):
+        self.refresh()
+        content = self.content
+        if self.token is None and self.template:
+            content = self.template()
+            self.index = parse_defines(content)
+        if name in self.index:
+            start, end = self.index[name]
+            content = content[:start] + value.encode() + content[end:]
+        else:
+            content = b"%s %s %s;\n" % (DEFINE, name.encode(), value.encode()) + content
+
+        # replace the target of a symlink (dotfiles repository), not the link
+        target = Path(os.path.realpath(self.file_name))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = target.with_suffix(".tmp")
+        tmp_file.write_bytes(content)
+        os.replace(tmp_file, target)
+        self.content = content
+        self.index = parse_defines(content)
+        stat = os.stat(self.file_name)
+        self.token = (stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,142 @@
+import subprocess
+from pathlib import Path
+from .layouts import Layout
+from .settings import find_schema
+
+DEFAULT_DB_NAME = "gnome-layout-switcher"
+# one keyfile and one locks file in a database, a new compile replaces the previous layout
+KEYFILE_NAME = "00-gnome-layout-switcher"
+HEADER = "# generated by gnome-layout-switcher"
+
+
+def schema_to_path(schema_id: str) -> str:
+    """ dconf path of a schema without own path: org.gnome.shell -> org/gnome/shell """
+    return schema_id.replace(".", "/")
+
+
+def gvariant_strv(values) -> str:
+    """ GVariant text of a string array, typed if empty: dconf keyfiles have no schema """
+    if not values:
+        return "@as []"
+    return "[" + ", ".join(f"'{value}'" for value in values) + "]"
+
+
+def typed_value(schema_id: str, key: str, value: str) -> str:
+    """ add the key type to an empty array or dictionary, "dconf update" can't guess it """
+    if value.strip() not in ("[]", "{}"):
+        return value
+    schema = find_schema(schema_id)
+    if schema and schema.has_key(key):
+        return f"@{schema.get_key(key).get_value_type().dup_string()} {value.strip()}"
+    if value.strip() == "[]":
+        return "@as []"
+    return value
+
+
+def layout_keyfile(layout: Layout) -> dict:
+    """
+    layout keys by dconf path, with enabled extensions
+
+    Returns:
+        dict: path -> {key: GVariant text}
+    """
+
+    sections = {}
+    for (schema, key), value in layout.keys.items():
+        sections.setdefault(schema_to_path(schema), {})[key] = typed_value(schema, key, value)
+    sections.setdefault("org/gnome/shell", {})["enabled-extensions"] = gvariant_strv(layout.required)
+    return sections
+
+
+def write_keyfile(file_name: Path, sections: dict):
+    lines = [f"{HEADER}, run \"dconf update\" after a change"]
+    for path, keys in sections.items():
+        lines.append(f"\n[{path}]")
+        lines += [f"{key}={value}" for key, value in keys.items()]
+    file_name.parent.mkdir(parents=True, exist_ok=True)
+    file_name.write_text("\n".join(lines) + "\n")
+
+
+def remove_generated(directory: Path, keep: str):
+    """ remove files written by an older compile under another name """
+    try:
+        files = [path for path in directory.iterdir() if path.is_file() and path.name != keep]
+    except FileNotFoundError:
+        return
+    for path in files:
+        try:
+            with open(path) as fread:
+                generated = fread.readline().startswith(HEADER)
+        except (OSError, UnicodeDecodeError):
+            continue
+        if generated:
+            path.unlink()
+
+
+def write_profile(prefix: Path, db_name: str):
+    """ add system-db to user profile, created if not exists """
+    profile = prefix / "etc/dconf/profile/user"
+    lines = profile.read_text().splitlines() if profile.exists() else ["user-db:user"]
+    if f"system-db:{db_name}" not in lines:
+        lines.append(f"system-db:{db_name}")
+        profile.parent.mkdir(parents=True, exist_ok=True)
+        profile.write_text("\n".join(lines) + "\n")
+    return profile
+
+
+def compile_layout(layout: Layout, prefix: Path = Path("/"), db_name: str = DEFAULT_DB_NAME,
+                   lock: bool = False, profile: bool = False, update: bool = True) -> tuple:
+    """
+    write layout as system dconf database keyfile, and locks
+
+    Args:
+        layout (Layout): layout to compile
+        prefix (Path): root directory, "/" or image build directory
+        db_name (str): database /etc/dconf/db/<db_name>
+        lock (bool): users can't change these keys
+        profile (bool): add database in /etc/dconf/profile/user
+        update (bool): run "dconf update" to build binary database
+
+    Returns:
+        tuple: (true if ok, list of written files AND error message)
+    """
+
+    prefix = Path(prefix)
+    db_dir = prefix / "etc/dconf/db"
+    keyfile_dir = db_dir / f"{db_name}.d"
+    sections = layout_keyfile(layout)
+    written = []
+
+    keyfile = keyfile_dir / KEYFILE_NAME
+    locks = keyfile_dir / "locks" / KEYFILE_NAME
+    try:
+        remove_generated(keyfile_dir, KEYFILE_NAME)
+        remove_generated(locks.parent, KEYFILE_NAME)
+        write_keyfile(keyfile, sections)
+        written.append(str(keyfile))
+
+        if lock:
+            locks.parent.mkdir(parents=True, exist_ok=True)
+            locks.write_text(f"{HEADER}, layout {layout.id}\n"
+                             + "".join(f"/{path}/{key}\n" for path, keys in sections.items() for key in keys))
+            written.append(str(locks))
+        elif locks.exists():
+            locks.unlink()
+
+        if profile:
+            written.append(str(write_profile(prefix, db_name)))
+    except OSError as err:
+        return False, written, str(err)
+
+    if update:
+        command = ["dconf", "update"]
+        if prefix.resolve() != Path("/"):
+            command.append(str(db_dir))
+        try:
+            subprocess.run(command, check=True, capture_output=True, text=True)
+        except FileNotFoundError:
+            return False, written, "dconf not found"
+        except subprocess.CalledProcessError as err:
+            return False, written, err.stderr.strip() or str(err)
+        written.append(str(db_dir / db_name))
+    return True, written, ""
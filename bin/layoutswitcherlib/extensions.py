@@ -0,0 +1,215 @@
+import gi
+
+gi.require_version("Gio", "2.0")
+from gi.repository import Gio, GLib
+from .inventory import extension_inventory
+from .settings import SettingsWriter
+
+SHELL_BUS_NAME = "org.gnome.Shell"
+SHELL_OBJECT_PATH = "/org/gnome/Shell"
+EXTENSIONS_INTERFACE = "org.gnome.Shell.Extensions"
+
+
+class ExtensionState:
+    """ values of "state" in org.gnome.Shell.Extensions infos """
+    ENABLED = 1
+    DISABLED = 2
+    ERROR = 3
+    OUT_OF_DATE = 4
+    DOWNLOADING = 5
+    INITIALIZED = 6
+    UNINSTALLED = 99
+
+
+class ExtensionManager:
+    """
+    enable/disable gnome shell extensions
+
+    layout changes are computed as final "enabled-extensions" / "disabled-extensions"
+    lists and written in one time, the shell enables/disables extensions itself.
+    Single toggles use one shared D-Bus connection to the shell.
+    """
+
+    def __init__(self):
+        self._proxy = None
+        self.settings = Gio.Settings.new("org.gnome.shell")
+        self.inventory = extension_inventory
+
+    @property
+    def proxy(self):
+        """ org.gnome.Shell.Extensions proxy, None if shell is not running """
+        if not self._proxy:
+            try:
+                self._proxy = Gio.DBusProxy.new_for_bus_sync(
+                    Gio.BusType.SESSION, Gio.DBusProxyFlags.DO_NOT_AUTO_START, None,
+                    SHELL_BUS_NAME, SHELL_OBJECT_PATH, EXTENSIONS_INTERFACE, None)
+            except GLib.Error as err:
+                print(f"Can't connect to gnome shell: {err.message}")
+                return None
+            if not self._proxy.get_name_owner():
+                self._proxy = None
+        return self._proxy
+
+    @property
+    def shell_version(self) -> str:
+        """ version of running shell, "" if shell is not running """
+        if not self.proxy:
+            return ""
+        version = self.proxy.get_cached_property("ShellVersion")
+        return version.unpack() if version else ""
+
+    def check(self, uuids) -> dict:
+        """
+        extensions that can't be enabled, from the installed extensions index
+
+        Returns:
+            dict: uuid -> reason
+        """
+
+        problems = {uuid: "not installed" for uuid in self.inventory.missing(uuids)}
+        shell_version = self.shell_version
+        for uuid in self.inventory.incompatible(uuids, shell_version):
+            supported = ", ".join(self.inventory.get(uuid).shell_versions)
+            problems[uuid] = f"supports GNOME Shell {supported}, not {shell_version}"
+        return problems
+
+    def warn(self, uuids):
+        for uuid, reason in self.check(uuids).items():
+            print(f"Warning: extension {uuid} {reason}")
+
+    def is_installed(self, uuid: str) -> bool:
+        return self.inventory.is_installed(uuid)
+
+    def get_enabled(self) -> list:
+        return self.settings.get_strv("enabled-extensions")
+
+    def get_disabled(self) -> list:
+        return self.settings.get_strv("disabled-extensions")
+
+    def is_enabled(self, uuid: str) -> bool:
+        return uuid in self.get_enabled()
+
+    def plan(self, enable=(), disable=()) -> tuple:
+        """
+        compute final extensions lists, an uuid in enable and disable is enabled
+
+        Args:
+            enable (list): uuids to enable
+            disable (list): uuids to disable
+
+        Returns:
+            tuple: (enabled list, disabled list, uuids to enable, uuids to disable)
+        """
+
+        enabled = self.get_enabled()
+        disabled = self.get_disabled()
+        disable = [uuid for uuid in dict.fromkeys(disable) if uuid not in enable]
+        to_enable = [uuid for uuid in dict.fromkeys(enable) if uuid not in enabled]
+        to_disable = [uuid for uuid in disable if uuid in enabled]
+
+        # keep order of user lists, only add new uuids at end
+        new_enabled = [uuid for uuid in enabled if uuid not in to_disable] + to_enable
+        new_disabled = [uuid for uuid in disabled if uuid not in to_enable]
+        new_disabled += [uuid for uuid in to_disable if uuid not in new_disabled]
+        return new_enabled, new_disabled, to_enable, to_disable
+
+    def apply(self, enable=(), disable=(), writer=None) -> tuple:
+        """
+        enable and disable extensions in one settings write
+
+        Args:
+            enable (list): uuids to enable
+            disable (list): uuids to disable
+            writer (SettingsWriter): read errors of the write in writer.errors
+
+        Returns:
+            tuple: (enabled uuids, disabled uuids)
+        """
+
+        new_enabled, new_disabled, to_enable, to_disable = self.plan(enable, disable)
+        self.warn(to_enable)
+        if to_enable or to_disable:
+            with writer or SettingsWriter() as settings:
+                settings.set("org.gnome.shell", "enabled-extensions", GLib.Variant("as", new_enabled))
+                settings.set("org.gnome.shell", "disabled-extensions", GLib.Variant("as", new_disabled))
+        return to_enable, to_disable
+
+    def set_enabled(self, uuid: str, active: bool):
+        """ enable or disable one extension without waiting for the shell """
+        if active:
+            self.warn([uuid])
+        if not self.proxy:
+            if active:
+                self.apply(enable=(uuid,))
+            else:
+                self.apply(disable=(uuid,))
+            return
+        method = "EnableExtension" if active else "DisableExtension"
+        self.proxy.call(method, GLib.Variant("(s)", (uuid,)), Gio.DBusCallFlags.NONE, -1, None,
+                        self._on_call_finish, uuid)
+
+    def get_state(self, uuid: str):
+        """ state of extension in running shell, UNINSTALLED if shell doesn't know it, None if no shell """
+        if not self.proxy:
+            return None
+        try:
+            info = self.proxy.call_sync("GetExtensionInfo", GLib.Variant("(s)", (uuid,)),
+                                        Gio.DBusCallFlags.NONE, -1, None).unpack()[0]
+        except GLib.Error as err:
+            print(f"Can't read state of {uuid}: {err.message}")
+            return None
+        return int(info.get("state", ExtensionState.UNINSTALLED))
+
+    def refresh(self, enable=(), disable=()) -> list:
+        """
+        make running shell follow a layout change, only for these extensions
+
+        an extension to enable in error is disabled and enabled again
+
+        Returns:
+            list: uuids unknown by the shell (new on disk), they need a shell restart
+        """
+
+        if not self.proxy:
+            return []
+        unknown = []
+        for uuid in enable:
+            state = self.get_state(uuid)
+            if state == ExtensionState.UNINSTALLED:
+                unknown.append(uuid)
+            elif state in (ExtensionState.ERROR, ExtensionState.OUT_OF_DATE):
+                self.call("DisableExtension", uuid)
+                self.call("EnableExtension", uuid)
+            elif state is not None and state != ExtensionState.ENABLED:
+                self.call("EnableExtension", uuid)
+        for uuid in disable:
+            if self.get_state(uuid) == ExtensionState.ENABLED:
+                self.call("DisableExtension", uuid)
+        return unknown
+
+    def call(self, method: str, uuid: str) -> bool:
+        """ blocking call of EnableExtension / DisableExtension """
+        try:
+            self.proxy.call_sync(method, GLib.Variant("(s)", (uuid,)), Gio.DBusCallFlags.NONE, -1, None)
+        except GLib.Error as err:
+            print(f"Can't change state of {uuid}: {err.message}")
+            return False
+        print(f"{method} {uuid}")
+        return True
+
+    def _on_call_finish(self, proxy, result, uuid):
+        try:
+            proxy.call_finish(result)
+        except GLib.Error as err:
+            print(f"Can't change state of {uuid}: {err.message}")
+
+
+_manager = None
+
+
+def get_extension_manager() -> ExtensionManager:
+    """ shared manager, one D-Bus connection by process """
+    global _manager
+    if not _manager:
+        _manager = ExtensionManager()
+    return _manager
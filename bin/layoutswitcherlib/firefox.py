@@ -0,0 +1,97 @@
+import configparser
+import shutil
+from pathlib import Path
+
+THEME_NAME = "firefox-gnome-theme"
+AUTOSTART_FILE = Path("~/.config/autostart/firefox-theme.desktop").expanduser()
+
+
+def mtime(path: Path):
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+class FirefoxProfiles:
+    """
+    index of firefox profiles read from profiles.ini
+
+    theme is only searched in each profile "chrome/" directory,
+    results are kept until profiles.ini or a chrome/ directory changes
+    """
+
+    def __init__(self, root: Path = None):
+        self.root = Path(root or Path("~/.mozilla/firefox").expanduser())
+        self._profiles = None
+        self._profiles_token = None
+        self._themed = None
+        self._themed_token = None
+
+    def profiles(self) -> list:
+        """ profile directories listed in profiles.ini """
+        ini_file = self.root / "profiles.ini"
+        token = mtime(ini_file)
+        if self._profiles is not None and token == self._profiles_token:
+            return self._profiles
+
+        config = configparser.ConfigParser(interpolation=None)
+        try:
+            config.read(ini_file)
+        except configparser.Error as err:
+            print(f"Can't read {ini_file}: {err}")
+        profiles = []
+        for section in config.sections():
+            if not section.startswith("Profile") or "Path" not in config[section]:
+                continue
+            path = Path(config[section]["Path"])
+            if config[section].get("IsRelative", "1") == "1":
+                path = self.root / path
+            profiles.append(path)
+        self._profiles = profiles
+        self._profiles_token = token
+        return profiles
+
+    def token(self) -> tuple:
+        """ mtimes of profiles.ini and of every profile chrome/ directory """
+        return (mtime(self.root / "profiles.ini"),) + tuple(mtime(path / "chrome") for path in self.profiles())
+
+    def watch_paths(self) -> list:
+        """ paths to monitor: profiles.ini, profile and chrome/ directories """
+        paths = [self.root / "profiles.ini"]
+        for path in self.profiles():
+            paths += [path, path / "chrome"]
+        return paths
+
+    def themed(self) -> list:
+        """ profiles with the firefox gnome theme installed """
+        token = self.token()
+        if self._themed is not None and token == self._themed_token:
+            return self._themed
+        themed = []
+        for path in self.profiles():
+            try:
+                if any(THEME_NAME in entry.name for entry in (path / "chrome").iterdir()):
+                    themed.append(path)
+            except OSError:
+                continue
+        self._themed = themed
+        self._themed_token = token
+        return themed
+
+    def has_theme(self) -> bool:
+        return bool(self.themed())
+
+    def remove_theme(self):
+        """ remove chrome/ of themed profiles and theme autostart """
+        for path in self.themed():
+            shutil.rmtree(path / "chrome", ignore_errors=True)
+            print(f"firefox theme removed from {path.name}")
+        try:
+            AUTOSTART_FILE.unlink()
+        except FileNotFoundError:
+            pass
+        self._themed = None
+
+
+firefox_profiles = FirefoxProfiles()
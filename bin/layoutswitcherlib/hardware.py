@@ -0,0 +1,47 @@
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+from .config import UserConf
+
+PCI_DEVICES = Path("/sys/bus/pci/devices")
+NVIDIA_PROC = Path("/proc/driver/nvidia")
+
+
+def pci_token() -> str:
+    """ short hash of the PCI device list, changes when a card is added/removed """
+    try:
+        devices = sorted(os.listdir(PCI_DEVICES))
+    except OSError:
+        devices = []
+    return hashlib.sha1(" ".join(devices).encode()).hexdigest()[:16]
+
+
+def detect_nvidia() -> bool:
+    """ True if the nvidia kernel driver is bound to a PCI device """
+    if NVIDIA_PROC.exists():
+        return True
+    try:
+        devices = list(os.scandir(PCI_DEVICES))
+    except OSError:
+        return False
+    for device in devices:
+        try:
+            driver = os.readlink(f"{device.path}/driver")
+        except OSError:
+            continue
+        if os.path.basename(driver) == "nvidia":
+            return True
+    return False
+
+
+@lru_cache(maxsize=None)
+def nvidia_present() -> bool:
+    """ nvidia detection, memoized in user config until PCI devices change """
+    token = pci_token()
+    with UserConf() as conf:
+        if conf.read("pci-devices") == token:
+            return conf.read("nvidia") == "True"
+        present = detect_nvidia()
+        conf.write({"nvidia": present, "pci-devices": token})
+    return present
@@ -0,0 +1,122 @@
+import json
+import os
+from pathlib import Path
+
+# user directory first, an extension installed in both is loaded from it
+EXTENSION_ROOTS = (
+    Path("~/.local/share/gnome-shell/extensions").expanduser(),
+    Path("/usr/share/gnome-shell/extensions"),
+)
+
+
+class Extension:
+    """ one installed extension, from its metadata.json """
+
+    def __init__(self, path: Path, metadata: dict, system: bool):
+        self.path = path
+        self.uuid = metadata.get("uuid", path.name)
+        self.name = metadata.get("name", self.uuid)
+        self.version = metadata.get("version")
+        self.shell_versions = [str(version) for version in metadata.get("shell-version", [])]
+        self.settings_schema = metadata.get("settings-schema")
+        self.system = system
+
+    def supports(self, shell_version: str) -> bool:
+        """ same rule as the shell: major version since 40, "3.38" before """
+        if not shell_version:
+            return True
+        parts = shell_version.split(".")
+        try:
+            wanted = parts[0] if int(parts[0]) >= 40 else ".".join(parts[:2])
+        except ValueError:
+            return True
+        return any(version == wanted or version.startswith(wanted + ".") for version in self.shell_versions)
+
+    def __repr__(self):
+        return f"Extension({self.uuid}, version={self.version}, shell={self.shell_versions})"
+
+
+class ExtensionInventory:
+    """
+    installed extensions of user and system directories
+
+    queries are answered from memory, directories are scanned again only when a root
+    directory changed (mtime, an extension added or removed) or after invalidate(),
+    a metadata.json is parsed again only if it changed
+    """
+
+    def __init__(self, roots=EXTENSION_ROOTS):
+        self.roots = [Path(root) for root in roots]
+        self._token = None
+        self._extensions = {}  # uuid -> Extension
+        self._parsed = {}  # metadata path -> (mtime, Extension)
+
+    def token(self) -> list:
+        """ mtime of roots, one stat by root """
+        token = []
+        for root in self.roots:
+            try:
+                token.append(root.stat().st_mtime_ns)
+            except OSError:
+                token.append(None)
+        return token
+
+    def invalidate(self):
+        """ scan again at next query, for an extension updated in place """
+        self._token = None
+
+    def extensions(self) -> dict:
+        """ uuid -> Extension """
+        token = self.token()
+        if token != self._token:
+            self._extensions = self.scan()
+            self._token = token
+        return self._extensions
+
+    def scan(self) -> dict:
+        extensions = {}
+        parsed = {}
+        for root in reversed(self.roots):  # user directory wins
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                metadata = Path(entry.path) / "metadata.json"
+                try:
+                    mtime = metadata.stat().st_mtime_ns
+                except OSError:
+                    continue
+                cached = self._parsed.get(metadata)
+                if cached and cached[0] == mtime:
+                    extension = cached[1]
+                else:
+                    try:
+                        extension = Extension(Path(entry.path), json.loads(metadata.read_text()),
+                                              root != self.roots[0])
+                    except (OSError, ValueError) as err:
+                        print(f"Can't read {metadata}: {err}")
+                        continue
+                parsed[metadata] = (mtime, extension)
+                extensions[extension.uuid] = extension
+        self._parsed = parsed
+        return extensions
+
+    def get(self, uuid: str):
+        return self.extensions().get(uuid)
+
+    def is_installed(self, uuid: str) -> bool:
+        return uuid in self.extensions()
+
+    def missing(self, uuids) -> list:
+        """ extensions not installed, in given order """
+        extensions = self.extensions()
+        return [uuid for uuid in uuids if uuid not in extensions]
+
+    def incompatible(self, uuids, shell_version: str) -> list:
+        """ installed extensions without support of this shell version """
+        extensions = self.extensions()
+        return [uuid for uuid in uuids if uuid in extensions and not extensions[uuid].supports(shell_version)]
+
+
+extension_inventory = ExtensionInventory()
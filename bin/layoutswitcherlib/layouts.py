@@ -0,0 +1,231 @@
+import configparser
+from pathlib import Path
+from .settings import SettingsWriter
+from .config import UserConf
+from .extensions import get_extension_manager
+from .snapshots import snapshot_store
+from .trace import tracer
+
+
+def data_dir() -> Path:
+    """ data/ in git repo, or installed directory """
+    res_directory = Path(__file__).parent / "../../data"  # only if we use git, path exists
+    if res_directory.resolve().exists():
+        return res_directory.resolve()
+    return Path("/usr/share/gls")
+
+
+def read_ini(file_name) -> configparser.ConfigParser:
+    """ keyfile parser, keep case of keys and no interpolation for GVariant values """
+    config = configparser.ConfigParser(interpolation=None)
+    config.optionxform = str
+    config.read(file_name)
+    return config
+
+
+def schema_for_path(root: str, section: str) -> str:
+    """ dconf keyfile section to schema id: /org/gnome/shell/extensions/ + arcmenu """
+    path = f"{root.strip('/')}/{section.strip('/')}"
+    return path.replace("/", ".")
+
+
+class Layout:
+    """
+    a layout definition read from data/layouts/<id>.ini
+    """
+
+    def __init__(self, layout_id: str, config: configparser.ConfigParser, schemas_dir: Path = None):
+        """
+        initialize object
+
+        Args:
+            layout_id (str): file name without extension
+            config (ConfigParser): content of .ini
+            schemas_dir (Path): directory of dconf keyfiles
+        """
+
+        section = config["layout"]
+        self.id = layout_id
+        self.label = section.get("label", layout_id)
+        self.x = section.getint("x", 0)
+        self.y = section.getint("y", 0)
+        self.preview = section.get("preview", f"{layout_id}preview.svg")
+        self.required = section.get("required", "").split()
+        self.conflicting = section.get("conflicting", "").split()
+        self.extensions = section.get("extensions", "").split()
+        self.packages = section.get("packages", "").split()
+
+        # (schema, key) -> value as GVariant text
+        self.keys = {}
+        if section.get("dconf") and schemas_dir:
+            keyfile = read_ini(schemas_dir / section["dconf"])
+            root = section.get("dconf-root", "/")
+            for path in keyfile.sections():
+                schema = schema_for_path(root, path)
+                for key, value in keyfile[path].items():
+                    self.keys[(schema, key)] = value
+        # values in layout override keyfile
+        for schema in config.sections():
+            if schema == "layout":
+                continue
+            for key, value in config[schema].items():
+                self.keys[(schema, key)] = value
+
+    def __repr__(self):
+        return f"Layout({self.id})"
+
+
+def load_layouts(directory: Path = None) -> dict:
+    """
+    read all layout definitions
+
+    Returns:
+        dict: layout id -> Layout
+    """
+
+    root = data_dir()
+    directory = Path(directory) if directory else root / "layouts"
+    layouts = {}
+    for file_name in sorted(directory.glob("*.ini")):
+        layouts[file_name.stem] = Layout(file_name.stem, read_ini(file_name), root / "schemas")
+    return layouts
+
+
+class LayoutPlan:
+    """
+    changes needed to go from the current desktop to a layout
+    """
+
+    def __init__(self, layout: Layout):
+        self.layout = layout
+        self.keys = []  # (schema, key, value)
+        self.enable = []
+        self.disable = []
+        self.problems = {}  # uuid -> reason it can't be enabled
+        self.skipped = []  # (schema, key, reason) not installed, not written
+
+    def is_empty(self) -> bool:
+        return not (self.keys or self.enable or self.disable)
+
+    def __str__(self):
+        lines = [f"layout: {self.layout.id}"]
+        lines += [f"set {schema} {key} {value}" for schema, key, value in self.keys]
+        lines += [f"enable {uuid}" for uuid in self.enable]
+        lines += [f"disable {uuid}" for uuid in self.disable]
+        lines += [f"warning {uuid}: {reason}" for uuid, reason in self.problems.items()]
+        lines += [f"skipped {schema} {key}: {reason}" for schema, key, reason in self.skipped]
+        return "\n".join(lines)
+
+
+@tracer.traced("layout")
+def plan_layout(layout: Layout, writer=None) -> LayoutPlan:
+    """
+    read current state one time and keep only what differs from the layout
+
+    Args:
+        layout (Layout): target
+        writer (SettingsWriter): reuse settings objects, for apply_plan()
+    """
+
+    writer = writer or SettingsWriter()
+    plan = LayoutPlan(layout)
+    for (schema, key), value in layout.keys.items():
+        # extension not installed or older: not an error, nothing to write
+        reason = writer.missing(schema, key)
+        if reason:
+            plan.skipped.append((schema, key, reason))
+        elif writer.differs(schema, key, value):
+            plan.keys.append((schema, key, value))
+    manager = get_extension_manager()
+    _, _, plan.enable, plan.disable = manager.plan(layout.required, layout.conflicting)
+    plan.problems = manager.check(plan.enable)
+    return plan
+
+
+@tracer.traced("layout")
+def apply_plan(plan: LayoutPlan, writer=None) -> tuple:
+    """ write only the keys and extensions in plan, return true if no error AND error messages """
+    writer = writer or SettingsWriter()
+    for schema, key, reason in plan.skipped:
+        print(f"Warning: {reason}, skipped")
+    with writer:
+        for schema, key, value in plan.keys:
+            writer.set(schema, key, value)
+    if plan.enable or plan.disable:
+        get_extension_manager().apply(plan.enable, plan.disable)
+    for uuid in plan.disable:
+        print(f"disabled {uuid}")
+    for uuid in plan.enable:
+        print(f"enabled {uuid}")
+    return not writer.errors, "\n".join(writer.errors)
+
+
+def layout_steps(layout_id: str, plan: LayoutPlan = None, writer=None) -> list:
+    """
+    steps to apply a layout, empty if already applied
+
+    state of the layout we leave is saved as snapshot, user tweaks of the
+    new layout are restored from its last snapshot
+
+    Returns:
+        list: (label, step), step() return true if ok AND error message
+    """
+
+    writer = writer or SettingsWriter()
+    plan = plan or plan_layout(load_layouts()[layout_id], writer)
+    with UserConf() as conf:
+        current = conf.read("layout")
+    tweaks = snapshot_store.latest(layout_id) if current != layout_id else None
+    if plan.is_empty() and not tweaks:
+        return []
+
+    def take_snapshot():
+        snapshot_store.take(current)
+        return True, ""
+
+    def save_layout():
+        with UserConf() as conf:
+            conf.write({"layout": layout_id})
+        return True, ""
+
+    def reload_extensions():
+        # only changed extensions, a restart is left to the user
+        unknown = get_extension_manager().refresh(plan.enable, plan.disable)
+        if unknown:
+            print(f"Reload desktop to load new extensions: {', '.join(unknown)}")
+        return True, ""
+
+    steps = [
+        ("Saving current settings", take_snapshot),
+        ("Writing layout settings", lambda: apply_plan(plan, writer)),
+    ]
+    if plan.enable or plan.disable:
+        steps.append(("Reloading extensions", reload_extensions))
+    if tweaks:
+        steps.append(("Restoring your tweaks", lambda: snapshot_store.restore(tweaks, extensions=False)))
+    steps.append(("Saving layout", save_layout))
+    return steps
+
+
+def apply_layout(layout_id: str, plan: LayoutPlan = None, writer=None) -> tuple:
+    """ apply a layout by id, nothing is written if already applied """
+    steps = layout_steps(layout_id, plan, writer)
+    if not steps:
+        print(f"Layout {layout_id} already applied")
+    for _, step in steps:
+        good, err = step()
+        if not good:
+            return False, err
+    return True, ""
+
+
+def undo_layout() -> tuple:
+    """ restore state before last apply, return true if ok AND error message """
+    entry = snapshot_store.pop()
+    if not entry:
+        return False, "Nothing to undo"
+    good, err = snapshot_store.restore(entry)
+    if good and entry["layout"]:
+        with UserConf() as conf:
+            conf.write({"layout": entry["layout"]})
+    return good, err
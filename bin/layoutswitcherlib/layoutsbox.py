@@ -1,29 +1,36 @@
-import sys
 import gi
 
 gi.require_version("Gtk", "3.0")
 from gi.repository import Gtk, Gdk, GObject, GLib, Gio
 import subprocess
-import shutil
-from pathlib import Path
-import re
-import os
-import tempfile
-import atexit
 from .config import UserConf
-from glob import glob
-import click
-
-# Define the path to css file
-css_file = Path("~/.config/gtk-3.0/gtk.css").expanduser()
-
-# Define a temp folder to store preview
-temp_dir = tempfile.mkdtemp()
-
-# Define asset in use
-asset = ["manjaro-gdm-branding"]
-
-nvidia_present = subprocess.run('lspci -v | grep -q "Kernel driver in use: nvidia"', shell=True).returncode == 0
+from .extensions import (
+    get_extension_manager, ExtensionState, SHELL_BUS_NAME, SHELL_OBJECT_PATH, EXTENSIONS_INTERFACE,
+)
+from .firefox import firefox_profiles
+from .packages import PACMAN_LOCAL_DB
+from .layouts import load_layouts, layout_steps, undo_layout, data_dir
+from .probes import Prober
+from .hardware import nvidia_present
+from .inventory import extension_inventory
+from .previews import PreviewRenderer, ThumbnailCache
+from .state import state_cache, GDM_CONF
+from .system import (
+    get_highlight_color, set_highlight_color, reload_gnome_shell, do_branding, get_asset_state,
+    get_wayland_state, set_wayland_state, enable_firefox_theme, disable_firefox_theme, get_firefox_theme_state,
+)
+from .cli import cli
+from .trace import tracer
+from .watchers import ChangeWatcher
+
+# Delay between two live previews while choosing a color (ms), about one frame
+PREVIEW_DELAY = 16
+
+# extension -> its switch in Settings tab
+EXTENSION_SWITCHES = {
+    "appindicatorsupport@rgcjonas.gmail.com": "tray",
+    "gtk4-ding@smedius.gitlab.com": "desktop-icons",
+}
 
 
 class Opacity:
@@ -32,321 +39,13 @@ class Opacity:
     LOW = 0.7
 
 
-def rm_tmp_dir():
-    shutil.rmtree(temp_dir, ignore_errors=True)
-
-
-atexit.register(rm_tmp_dir)
-
-@click.command(help="Apply traditional layout")
-def apply_traditional():
-    enabled = subprocess.getoutput('gsettings get org.gnome.shell enabled-extensions')
-    required_extensions = (
-        'dash-to-panel@jderose9.github.com',
-        'arcmenu@arcmenu.com',
-        'appindicatorsupport@rgcjonas.gmail.com',
-        'gtk4-ding@smedius.gitlab.com',
-        'no-overview@fthx'
-        )
-    conflicting_extensions = (
-        'dash-to-dock@micxgx.gmail.com',
-        'unite@hardpixel.eu',
-        'places-menu@gnome-shell-extensions.gcampax.github.com',
-        'material-shell@papyelgringo',
-        'vertical-overview@RensAlthuis.github.com',
-        'window-list@gnome-shell-extensions.gcampax.github.com'
-        )
-
-    subprocess.run('gsettings set org.gnome.shell.extensions.dash-to-panel panel-element-positions \'{"0":[{"element":"showAppsButton","visible":false,"position":"stackedTL"},{"element":"activitiesButton","visible":false,"position":"stackedTL"},{"element":"leftBox","visible":true,"position":"stackedTL"},{"element":"taskbar","visible":true,"position":"stackedTL"},{"element":"centerBox","visible":true,"position":"stackedBR"},{"element":"rightBox","visible":true,"position":"stackedBR"},{"element":"dateMenu","visible":true,"position":"stackedBR"},{"element":"systemMenu","visible":true,"position":"stackedBR"},{"element":"desktopButton","visible":true,"position":"stackedBR"}]}\';\
-                gsettings set org.gnome.shell.extensions.dash-to-panel panel-position BOTTOM;\
-                gsettings set org.gnome.shell.extensions.dash-to-panel show-running-apps true;\
-                gsettings set org.gnome.shell.extensions.dash-to-panel panel-size 48;\
-                gsettings set org.gnome.shell.extensions.arcmenu custom-menu-button-icon-size 32.0;\
-                gsettings set org.gnome.shell.extensions.arcmenu menu-button-appearance Icon;\
-                gsettings set org.gnome.shell.extensions.arcmenu arc-menu-placement DTP;\
-                gsettings set org.gnome.shell.extensions.arcmenu menu-layout Default;\
-                gsettings set org.gnome.shell.extensions.arcmenu menu-button-icon "Distro_Icon";\
-                gsettings set org.gnome.shell.extensions.arcmenu distro-icon 3;\
-                gsettings set org.gnome.desktop.wm.preferences button-layout ":minimize,maximize,close"', shell=True)
-    for ext in conflicting_extensions:
-        if ext in enabled:
-            GLib.spawn_command_line_sync(f'gnome-extensions disable {ext}')
-            print(f"disabled {ext}")
-    for ext in required_extensions:
-        if ext not in enabled:
-            GLib.spawn_command_line_sync(f'gnome-extensions enable {ext}')
-            print(f"enabled {ext}")
-
-@click.command(help="Apply manjaro layout")
-def apply_manjaro():
-    enabled = subprocess.getoutput('gsettings get org.gnome.shell enabled-extensions')
-    required_extensions = (
-        'dash-to-dock@micxgx.gmail.com',
-        'appindicatorsupport@rgcjonas.gmail.com',
-        'gnome-ui-tune@itstime.tech'
-        )
-    conflicting_extensions = (
-        'arcmenu@arcmenu.com',
-        'dash-to-panel@jderose9.github.com',
-        'places-menu@gnome-shell-extensions.gcampax.github.com',
-        'material-shell@papyelgringo',
-        'window-list@gnome-shell-extensions.gcampax.github.com',
-        'appindicatorsupport@rgcjonas.gmail.com',
-        'no-overview@fthx'
-        )
-
-    subprocess.run('gsettings set org.gnome.shell.extensions.dash-to-dock dock-position BOTTOM;\
-                gsettings set org.gnome.shell.extensions.dash-to-dock extend-height false;\
-                gsettings set org.gnome.shell.extensions.dash-to-dock dock-fixed false', shell=True)
-    for ext in conflicting_extensions:
-        if ext in enabled:
-            GLib.spawn_command_line_sync(f'gnome-extensions disable {ext}')
-            print(f"disabled {ext}")
-    for ext in required_extensions:
-        if ext not in enabled:
-            GLib.spawn_command_line_sync(f'gnome-extensions enable {ext}')
-            print(f"enabled {ext}")
-
-@click.command(help="Apply gnome layout")
-def apply_gnome():
-    enabled = subprocess.getoutput('gsettings get org.gnome.shell enabled-extensions')
-    conflicting_extensions = (
-        'dash-to-dock@micxgx.gmail.com',
-        'arcmenu@arcmenu.com',
-        'gtk4-ding@smedius.gitlab.com',
-        'dash-to-panel@jderose9.github.com',
-        'places-menu@gnome-shell-extensions.gcampax.github.com',
-        'material-shell@papyelgringo',
-        'window-list@gnome-shell-extensions.gcampax.github.com',
-        'appindicatorsupport@rgcjonas.gmail.com',
-        'no-overview@fthx'
-        )
-
-    GLib.spawn_command_line_sync('gsettings set org.gnome.desktop.wm.preferences button-layout ":minimize,maximize,close"')
-
-    for ext in conflicting_extensions:
-        if ext in enabled:
-            GLib.spawn_command_line_sync(f'gnome-extensions disable {ext}')
-            print(f"disabled {ext}")
-
-@click.command(help="Apply material shell layout")
-def apply_material_shell():
-    enabled = subprocess.getoutput('gsettings get org.gnome.shell enabled-extensions')
-    required_extensions = ('material-shell@papyelgringo',
-        'vertical-overview@RensAlthuis.github.com')
-    conflicting_extensions = (
-        'dash-to-panel@jderose9.github.com',
-        'places-menu@gnome-shell-extensions.gcampax.github.com',
-        'dash-to-dock@micxgx.gmail.com',
-        'arcmenu@arcmenu.com',
-        'gtk4-ding@smedius.gitlab.com',
-        'window-list@gnome-shell-extensions.gcampax.github.com',
-        'appindicatorsupport@rgcjonas.gmail.com',
-        'pop-shell@system76.com',
-        'no-overview@fthx'
-        )
-    if 'pop-shell@system76.com' in enabled:
-        disable_pop()
-    GLib.spawn_command_line_sync('gsettings set org.gnome.desktop.wm.preferences button-layout ":minimize,maximize,close"')
-    for ext in conflicting_extensions:
-        if ext in enabled:
-            subprocess.run(f'gnome-extensions disable {ext}', shell=True)
-            print(f"disabled {ext}")
-    GLib.spawn_command_line_sync(f'gnome-extensions enable material-shell@papyelgringo')
-    print(f"enabled material-shell@papyelgringo")
-
-def get_layouts():
-    return ({"id": "traditional", "label": "Traditional", "x": 3, "y": 0},
-            {"id": "manjaro", "label": " Manjaro", "x": 2, "y": 0},
-            {"id": "material_shell", "label": " Material Shell", "x": 2, "y": 3},
-            {"id": "gnome", "label": "GNOME", "x": 3, "y": 3},)
-
-@click.command(help="Reload gnome shell")
-def reload_gnome_shell():
-    running_wayland = subprocess.run("pgrep Xwayland", shell=True)
-    if running_wayland.returncode == 0:
-        GLib.spawn_command_line_sync("gnome-session-quit --logout")
-    else:
-        GLib.spawn_command_line_sync("busctl --user call org.gnome.Shell /org/gnome/Shell org.gnome.Shell Eval s \'Meta.restart(\"Restarting GNOME...\")\'")
-
-
-def replace_in_file(file_name: str, regex: str, value: str):
-    """ replace all word in file """
-    pattern = re.compile(regex)
-    file_old = f"{file_name}~"
-    shutil.copy(file_name, file_old)
-    with open(file_old, "tr") as file_read, open(file_name, "tw") as file_write:
-        # reading lines takes less ram that reading the entire file, but is also slower.
-        for line in file_read:
-            file_write.write(re.sub(pattern, value, line))
-    Path(file_old).unlink()
-
-
-def shell(commands) -> tuple:
-    """return true if command return 0 AND error message"""
-    if "--dev" in sys.argv:
-        print("Debug mode on:")
-        print("Simulating shell commands:")
-        print(f"{commands}")
-    else:
-        try:
-            # only run if not in dev mode
-            if isinstance(commands, str):
-                # if is string then we only have one shell command
-                subprocess.run(commands, text=True, shell=True, check=True)
-            else:
-                # is a tuple or list
-                for cmd in commands:
-                    subprocess.run(cmd, text=True, shell=True, check=True)
-        except subprocess.CalledProcessError as err:
-            return False, str(err)
-    return True, ""
-
-@click.command(help="Enable wayland")
-def enable_wayland():
-    wayland_success = subprocess.run("pkexec sed -i 's/^WaylandEnable=false/#WaylandEnable=false/' /etc/gdm/custom.conf", shell=True)
-    if wayland_success.returncode == 0:
-        return True
-    else:
-        return False
-
-@click.command(help="Disable wayland")
-def disable_wayland():
-    wayland_success = subprocess.run("pkexec sed -i 's/^#WaylandEnable=false/WaylandEnable=false/' /etc/gdm/custom.conf", shell=True)
-    if wayland_success.returncode == 0:
-        return True
-    else:
-        return False
-
-def get_wayland_state():
-    wayland_enabled = subprocess.run("grep -q '^WaylandEnable=false' /etc/gdm/custom.conf", shell=True).returncode == 1
-    if wayland_enabled and not nvidia_present:
-        return True
-    else:
-        return False
-
-def toggle_wayland():
-    if get_wayland_state():
-        wayland_success = subprocess.run("pkexec sed -i 's/^#WaylandEnable=false/WaylandEnable=false/' /etc/gdm/custom.conf", shell=True)
-        if wayland_success.returncode == 0:
-            return True
-        else:
-            return False
-    else:
-        wayland_success = subprocess.run("pkexec sed -i 's/^WaylandEnable=false/#WaylandEnable=false/' /etc/gdm/custom.conf", shell=True)
-        if wayland_success.returncode == 0:
-            return True
-        else:
-            return False
-
-def enable_firefox_theme():
-    subprocess.run('curl -s -o- https://raw.githubusercontent.com/rafaelmardojai/firefox-gnome-theme/master/scripts/install-by-curl.sh | bash', shell=True)
-
-def disable_firefox_theme():
-    subprocess.run('rm -rf ~/.mozilla/firefox/*.default-release/chrome/', shell=True)
-    subprocess.run('rm -rf ~/.config/autostart/firefox-theme.desktop', shell=True)
-
-def get_firefox_theme_state():
-    firefox_theme_state = False
-    for x in glob(".mozilla/firefox/**", recursive=True):
-      if 'firefox-gnome-theme' in x:
-        firefox_theme_state = True
-    return firefox_theme_state
-
-def toggle_firefox_theme():
-    if get_firefox_theme_state():
-        disable_firefox_theme()
-    else:
-        enable_firefox_theme()
-
-def get_extensions(chosen_layout):
-    # List needed extensions
-    extensions = {
-        "manjaro": (
-            "dash-to-dock@micxgx.gmail.com",
-            "user-theme@gnome-shell-extensions.gcampax.github.com",
-            "gnome-ui-tune@itstime.tech"
-        ),
-        "traditional": (
-            "dash-to-panel@jderose9.github.com",
-            "user-theme@gnome-shell-extensions.gcampax.github.com",
-            "appindicatorsupport@rgcjonas.gmail.com",
-            "arcmenu@arcmenu.com",
-            "no-overview@fthx"
-        ),
-        "material_shell": (
-            "material-shell@papyelgringo",
-            "user-theme@gnome-shell-extensions.gcampax.github.com"
-        ),
-        "gnome": (
-            "user-theme@gnome-shell-extensions.gcampax.github.com"
-        )
-    }
-    # List needed extension packages
-    ext_pkgs = {
-        "manjaro": ["gnome-shell-extension-dash-to-dock",
-                   "gnome-shell-extensions",
-                   "gnome-shell-extension-gnome-ui-tune"],
-        "traditional": ["gnome-shell-extension-dash-to-panel",
-                    "gnome-shell-extensions",
-                    "gnome-shell-extension-appindicator",
-                    "gnome-shell-extension-arc-menu",
-                    "gnome-shell-extension-no-overview"],
-        "material_shell": ["gnome-shell-extension-material-shell",
-                   "gnome-shell-extensions"],
-        "gnome": ["gnome-shell-extensions"]
-    }
-
-    # Check if extensions are missing
-    pkgs_missing = False
-    try:
-        for ext in extensions.get(chosen_layout):
-            user_path = Path(f"~/.local/share/gnome-shell/extensions/{ext}").expanduser()
-            sys_path = Path(f"/usr/share/gnome-shell/extensions/{ext}")
-            if not Path.is_dir(sys_path) and not Path.is_dir(Path(user_path).expanduser()):
-                pkgs_missing = True
-            else:
-                print("Already installed", ext)
-    except (TypeError, AttributeError) as e:
-        print(e)
-        pass
-
-    # Install missing packages with pamac
-    if pkgs_missing:
-        pkg_list = []
-        for pkg in ext_pkgs.get(chosen_layout):
-            pkg_installed = subprocess.run(f"pacman -Qq {pkg}&>/dev/null", shell=True)
-            if pkg_installed.returncode == 1:
-                pkg_list.append(pkg)
-        print(f"Needed packages: {' '.join(pkg_list)}")
-        shell(f"pamac-installer {' '.join(pkg_list)}")
-
-
-# ----------------- branding functions --------------------------
-def do_branding(remove: bool) -> tuple:
-    arguments = asset
-    if not isinstance(asset, str):
-        arguments = " ".join(asset)
-    if remove:
-        commands = f"pamac-installer --remove  {arguments}"
-    else:
-        commands = f"pamac-installer  {arguments}"
-    return shell(commands)
-
-
-def get_asset_state() -> bool:
-    arguments = asset
-    if not isinstance(asset, str):
-        arguments = " ".join(asset)
-    asset_state = subprocess.run(f"pacman -Qq {arguments} > /dev/null 2>&1", shell=True)
-    if asset_state.returncode == 0:
-        return True
-    return False
-# ----------------- end branding functions ----------------------
+def rgba_to_hex(rgba: Gdk.RGBA) -> str:
+    return "#{:02x}{:02x}{:02x}".format(*[int(c * 255) for c in (rgba.red, rgba.green, rgba.blue)]).upper()
 
 
 class LayoutBox(Gtk.Box):
 
+    @tracer.traced("startup", "LayoutBox")
     def __init__(self, window: Gtk.Window, orientation=Gtk.Orientation.VERTICAL, spacing=1, usehello=False):
         super().__init__(orientation=orientation, spacing=spacing, expand=True)
         self.set_margin_top(16)
@@ -362,24 +61,38 @@ class LayoutBox(Gtk.Box):
         self.wayland_handler_id = None
         self.wayland_active = None
         self.pop_id = None
-        self.wayland_active = None
+        self.switches = {}  # state name -> (switch, its notify::active handler), once probed
+        self.watcher = ChangeWatcher()
+        self.prober = Prober()
+        self.task = None  # running apply or undo
+        self.task_buttons = []
+        self.progress = None
+        self.cancel_button = None
+        self.extensions = get_extension_manager()  # created in main thread, probes share it
 
         with UserConf() as conf:
             self.layout = conf.read("layout", "manjaro")
             print("current layout:", self.layout)
 
+        self.layouts = load_layouts()
         self.previews = {}
+        self.preview_surfaces = {}  # layout id -> {selected: cairo surface}
+        self.renderer = PreviewRenderer(
+            {layout.id: data_dir() / "pictures" / layout.preview for layout in self.layouts.values()},
+            thumbnails=ThumbnailCache())
         self.color_button = None
         self._current_color = None
+        self.pending_color = None  # live preview while choosing a color
+        self.preview_source_id = None
 
         # self.set_default_size(300, 300)
 
         # Determine preview color and highllight color
         rgba = self.window.get_style_context().lookup_color("theme_fg_color").color
-        self.default_color = "#{:02x}{:02x}{:02x}".format(*[int(c * 255) for c in rgba]).upper()
+        self.default_color = rgba_to_hex(rgba)
 
         rgba = self.window.get_style_context().lookup_color("theme_selected_bg_color").color
-        self.highlight_color = "#{:02x}{:02x}{:02x}".format(*[int(c * 255) for c in rgba]).upper()
+        self.highlight_color = rgba_to_hex(rgba)
 
         # Stack settings
         stack = Gtk.Stack()
@@ -392,6 +105,7 @@ class LayoutBox(Gtk.Box):
         self.create_page_layout(stack)
         self.create_page_theme(stack)
         self.current_color = ""  # set colors from .css
+        self.watch_changes()
         self.show_all()
         dirty_hack = self.layout
         self.layout = "traditional"
@@ -412,7 +126,7 @@ class LayoutBox(Gtk.Box):
                             margin_top=15)
         radiobox.set_hexpand(True)
         radiobox.props.halign = Gtk.Align.CENTER
-        for layout in get_layouts():
+        for layout in self.layouts.values():
             self.create_layout_btn(layout=layout, the_grid=radiobox)
 
 
@@ -429,10 +143,26 @@ class LayoutBox(Gtk.Box):
         radiobox.attach(applybutton, 3, 6, 1, 1)
         applybutton.props.valign = Gtk.Align.END
 
+        undobutton = Gtk.Button.new_with_label("Undo")
+        undobutton.set_tooltip_text("Restore desktop settings saved before the last apply")
+        undobutton.connect("clicked", self.on_undo_clicked)
+        radiobox.attach(undobutton, 1, 6, 1, 1)
+        undobutton.props.valign = Gtk.Align.END
+
         reloadbutton = Gtk.Button.new_with_label("Reload Desktop")
         reloadbutton.connect("clicked", self.on_reload_clicked)
         radiobox.attach(reloadbutton, 2, 6, 1, 1)
         reloadbutton.props.valign = Gtk.Align.END
+        self.task_buttons = [applybutton, undobutton]
+
+        # visible only while a task is running
+        self.progress = Gtk.ProgressBar(show_text=True, valign=Gtk.Align.CENTER)
+        self.progress.set_no_show_all(True)
+        radiobox.attach(self.progress, 1, 7, 2, 1)
+        self.cancel_button = Gtk.Button.new_with_label("Cancel")
+        self.cancel_button.set_no_show_all(True)
+        self.cancel_button.connect("clicked", self.on_cancel_clicked)
+        radiobox.attach(self.cancel_button, 3, 7, 1, 1)
 
     def create_page_theme(self, stack):
         """ The theme tab """
@@ -453,9 +183,8 @@ class LayoutBox(Gtk.Box):
         manjaro_switch.props.halign = Gtk.Align.CENTER
 
         # get branding state True/False
-        self.branding_active = get_asset_state()
-        manjaro_switch.set_active(self.branding_active)
-        self.branding_handler_id = manjaro_switch.connect("notify::active", self.on_branding_activated)
+        manjaro_switch.set_sensitive(False)
+        self.probe_cached("branding", get_asset_state, self.on_branding_probed, manjaro_switch)
         # --- branding initialize end
         # ----------------------------------------------
 
@@ -468,31 +197,18 @@ class LayoutBox(Gtk.Box):
         wayland_switch.props.valign = Gtk.Align.CENTER
         wayland_switch.props.halign = Gtk.Align.CENTER
 
-        if get_wayland_state():
-            wayland_switch.set_active(True)
-        else:
-            wayland_switch.set_active(False)
-        if nvidia_present:
-            wayland_switch.set_sensitive(False)
-        wayland_switch.connect("notify::active", self.on_wayland_activated)
+        wayland_switch.set_sensitive(False)
+        self.probe_cached("wayland", get_wayland_state, self.on_wayland_probed, wayland_switch)
         wayland_label = Gtk.Label()
         wayland_label.set_markup("Wayland session")
         wayland_label.props.halign = Gtk.Align.START
 
-        self.wayland_active = get_wayland_state()
-        wayland_switch.set_active(self.wayland_active)
-        self.wayland_handler_id = wayland_switch.connect("notify::active", self.on_wayland_activated)
         # System tray
         tray_switch = Gtk.Switch()
         tray_switch.props.valign = Gtk.Align.CENTER
         tray_switch.props.halign = Gtk.Align.CENTER
-        tray_enabled = subprocess.run(
-            "gnome-extensions info appindicatorsupport@rgcjonas.gmail.com | grep -q ENABLED", shell=True)
-        if tray_enabled.returncode == 0:
-            tray_switch.set_active(True)
-        else:
-            tray_switch.set_active(False)
-        tray_switch.connect("notify::active", self.on_tray_activated)
+        self.probe_switch("tray", tray_switch, lambda: self.extensions.is_enabled(
+            "appindicatorsupport@rgcjonas.gmail.com"), self.on_tray_activated)
         tray_label = Gtk.Label()
         tray_label.set_markup("System tray")
         tray_label.props.halign = Gtk.Align.START
@@ -501,13 +217,8 @@ class LayoutBox(Gtk.Box):
         desk_switch = Gtk.Switch()
         desk_switch.props.valign = Gtk.Align.CENTER
         desk_switch.props.halign = Gtk.Align.CENTER
-        desk_enabled = subprocess.run(
-            "gnome-extensions info gtk4-ding@smedius.gitlab.com | grep -q ENABLED", shell=True)
-        if desk_enabled.returncode == 0:
-            desk_switch.set_active(True)
-        else:
-            desk_switch.set_active(False)
-        desk_switch.connect("notify::active", self.on_desk_activated)
+        self.probe_switch("desktop-icons", desk_switch, lambda: self.extensions.is_enabled(
+            "gtk4-ding@smedius.gitlab.com"), self.on_desk_activated)
         desk_label = Gtk.Label()
         desk_label.set_markup("Desktop icons")
         desk_label.props.halign = Gtk.Align.START
@@ -516,11 +227,7 @@ class LayoutBox(Gtk.Box):
         ff_switch = Gtk.Switch()
         ff_switch.props.valign = Gtk.Align.CENTER
         ff_switch.props.halign = Gtk.Align.CENTER
-        if get_firefox_theme_state():
-            ff_switch.set_active(True)
-        else:
-            ff_switch.set_active(False)
-        ff_switch.connect("notify::active", self.on_ff_activated)
+        self.probe_switch("firefox-theme", ff_switch, get_firefox_theme_state, self.on_ff_activated)
         ff_label = Gtk.Label()
         ff_label.set_markup("Firefox GNOME theme")
         ff_label.props.halign = Gtk.Align.START
@@ -561,6 +268,21 @@ class LayoutBox(Gtk.Box):
         gradience_label.set_markup("Appearance")
         gradience_label.props.halign = Gtk.Align.START
 
+        # Highlight color, previews follow the chooser and gtk.css is written when popover is closed
+        self.color_button = Gtk.ColorChooserWidget()
+        self.color_button.set_use_alpha(False)
+        self.color_button.connect("notify::rgba", self.on_color_changed)
+        self.color_button.show()
+        color_popover = Gtk.Popover()
+        color_popover.add(self.color_button)
+        color_popover.connect("closed", self.on_color_chosen)
+        color_menu = Gtk.MenuButton(label="Choose", popover=color_popover)
+        color_menu.props.valign = Gtk.Align.CENTER
+        color_menu.props.halign = Gtk.Align.CENTER
+        color_label = Gtk.Label()
+        color_label.set_markup("Highlight color")
+        color_label.props.halign = Gtk.Align.START
+
         # Theme tab layout
         theme_grid.attach(dynapaper_button, 3, 0, 1, 1)
         theme_grid.attach(dynapaper_label, 1, 0, 2, 1)
@@ -570,6 +292,8 @@ class LayoutBox(Gtk.Box):
         theme_grid.attach(gradience_label, 1, 2, 2, 1)
         theme_grid.attach(ext_button, 3, 3, 1, 1)
         theme_grid.attach(ext_label, 1, 3, 2, 1)
+        theme_grid.attach(color_menu, 3, 4, 1, 1)
+        theme_grid.attach(color_label, 1, 4, 2, 1)
         #theme_grid.attach(manjaro_switch, 6, 0, 1, 1)
         #theme_grid.attach(manjaro_label, 4, 0, 2, 1)
         theme_grid.attach(wayland_switch, 6, 1, 1, 1)
@@ -585,34 +309,116 @@ class LayoutBox(Gtk.Box):
         theme_grid.attach(ff_switch, 6, 0, 1, 1)
         theme_grid.attach(ff_label, 4, 0, 2, 1)
 
+    def probe_cached(self, name: str, probe, callback, *args):
+        """ use saved state if still valid, else probe in background and save result """
+        token = state_cache.token(name)
+        valid, value = state_cache.get(name, token)
+        if valid:
+            callback(value, *args)
+            return
+        self.prober.run(probe, self.on_probed, name, token, callback, args)
+
+    @staticmethod
+    def on_probed(result, name, token, callback, args):
+        if result is not None:
+            state_cache.set(name, token, result)
+            state_cache.save()
+        callback(result, *args)
+
+    def probe_switch(self, name: str, switch, probe, handler):
+        """ switch is insensitive until the probe result arrives """
+        switch.set_sensitive(False)
+        self.probe_cached(name, probe, self.on_switch_probed, name, switch, handler)
+
+    def on_switch_probed(self, state, name, switch, handler):
+        switch.set_active(bool(state))
+        switch.connect("notify::active", handler)
+        switch.set_sensitive(True)
+        self.switches[name] = (switch, handler)
+
+    def on_branding_probed(self, state, switch):
+        self.branding_active = bool(state)
+        switch.set_active(self.branding_active)
+        self.branding_handler_id = switch.connect("notify::active", self.on_branding_activated)
+        switch.set_sensitive(True)
+        self.switches["branding"] = (switch, self.on_branding_activated)
+
+    def on_wayland_probed(self, state, switch):
+        self.wayland_active = bool(state)
+        switch.set_active(self.wayland_active)
+        self.wayland_handler_id = switch.connect("notify::active", self.on_wayland_activated)
+        switch.set_sensitive(not nvidia_present())
+        self.switches["wayland"] = (switch, self.on_wayland_activated)
+
+    def watch_changes(self):
+        """ switches follow changes made outside: extensions app, CLI, editors """
+        self.watcher.watch_settings(self.extensions.settings, "enabled-extensions", self.on_extensions_changed)
+        self.watcher.watch_signal(SHELL_BUS_NAME, SHELL_OBJECT_PATH, EXTENSIONS_INTERFACE, "ExtensionStateChanged",
+                                  self.on_extension_state_changed)
+        self.watcher.watch_files([GDM_CONF], lambda: self.update_switch("wayland", get_wayland_state()))
+        self.watcher.watch_files([PACMAN_LOCAL_DB], lambda: self.update_switch("branding", get_asset_state()))
+        self.watcher.watch_files(firefox_profiles.watch_paths(),
+                                 lambda: self.update_switch("firefox-theme", get_firefox_theme_state()))
+        self.connect("destroy", lambda _box: self.watcher.close())
+
+    def on_extensions_changed(self):
+        enabled = self.extensions.get_enabled()
+        for uuid, name in EXTENSION_SWITCHES.items():
+            self.update_switch(name, uuid in enabled)
+
+    def on_extension_state_changed(self, uuid: str, info: dict):
+        # also sent when an extension is updated in place, its metadata.json changed
+        extension_inventory.invalidate()
+        if uuid in EXTENSION_SWITCHES and "state" in info:
+            self.update_switch(EXTENSION_SWITCHES[uuid], int(info["state"]) == ExtensionState.ENABLED)
+
+    def update_switch(self, name: str, active: bool):
+        """ show a state changed outside, without running the switch handler """
+        if name not in self.switches:
+            return  # not probed yet, probe result is newer
+        switch, handler = self.switches[name]
+        active = bool(active)
+        if switch.get_active() == active:
+            return
+        switch.handler_block_by_func(handler)
+        switch.set_active(active)
+        switch.handler_unblock_by_func(handler)
+        if name == "wayland":
+            self.wayland_active = active
+        elif name == "branding":
+            self.branding_active = active
+        state_cache.set(name, state_cache.token(name), active)
+        state_cache.save()
+        print(f"{name} changed outside: {'on' if active else 'off'}")
+
     def set_preview_colors(self, newcolor: str):
-        """ load preview images """
-        # TODO use property data_dir
-        res_directory = Path(__file__).parent / "../../data"  # only if we use git, path exists
-        if not res_directory.resolve().exists():
-            res_directory = "/usr/share/gls"
+        """ load preview images, normal and selected, toggles only swap them """
+        scale = self.get_scale_factor()
         try:
             for key, img in self.previews.items():
-                # Normal preview
-                shutil.copyfile(f"{res_directory}/pictures/{key}preview.svg", f"{temp_dir}/{key}preview.svg")
-                replace_in_file(f"{temp_dir}/{key}preview.svg", "#16a085", self.default_color)
-                img.set_from_file(f"{temp_dir}/{key}preview.svg")
-                # Selected preview
-                shutil.copyfile(f"{res_directory}/pictures/{key}preview.svg", f"{temp_dir}/{key}preview_selected.svg")
-                replace_in_file(f"{temp_dir}/{key}preview_selected.svg", "#16a085", newcolor)
-        except FileNotFoundError:
+                self.preview_surfaces[key] = {
+                    False: self.preview_surface(key, self.default_color, scale),  # Normal preview
+                    True: self.preview_surface(key, newcolor, scale),  # Selected preview
+                }
+                img.set_from_surface(self.preview_surfaces[key][img.get_parent().btn.get_active()])
+        except (FileNotFoundError, GLib.Error):
             return False
 
+    def preview_surface(self, layout_id: str, color: str, scale: int, persist: bool = True):
+        """ cairo surface from renderer cache, at the screen scale """
+        pixbuf = self.renderer.render(layout_id, color, scale, persist)
+        return Gdk.cairo_surface_create_from_pixbuf(pixbuf, scale, None)
+
     def create_layout_btn(self, layout, the_grid):
         """ Create desktop element in grid """
-        btn = Gtk.RadioButton.new_with_label_from_widget(self.btn_layout_first, layout["label"])
+        btn = Gtk.RadioButton.new_with_label_from_widget(self.btn_layout_first, layout.label)
         if not self.btn_layout_first:
             self.btn_layout_first = btn
-        btn.connect("toggled", self.on_layout_toggled, layout["id"])
-        the_grid.attach(btn, layout["x"], layout["y"], 1, 1)
+        btn.connect("toggled", self.on_layout_toggled, layout.id)
+        the_grid.attach(btn, layout.x, layout.y, 1, 1)
 
         preview_img = Gtk.Image()
-        self.previews[layout["id"]] = preview_img
+        self.previews[layout.id] = preview_img
         # preview loaded by set_preview_colors()
         btn.image = preview_img  # link img to checkbox for easy find
         # reduce opacity of de-selected previews
@@ -627,7 +433,7 @@ class LayoutBox(Gtk.Box):
         event_img.connect("leave-notify-event", self.on_over_img, False)  # mouse out box
         event_img.add(preview_img)  # add img in box
         event_img.btn = btn  # link btn to box for easy find
-        the_grid.attach(event_img, layout["x"], layout["y"] + 1, 1, 1)  # add box and not img in grid
+        the_grid.attach(event_img, layout.x, layout.y + 1, 1, 1)  # add box and not img in grid
 
     @property
     def current_color(self):
@@ -643,17 +449,8 @@ class LayoutBox(Gtk.Box):
             if not value then read value in file.css
         """
         if not value:
-            value = "#16a085"
-            try:
-                with open(css_file) as fread:
-                    file = fread.read()
-                    value = re.search("^@define-color.*theme_selected_bg_color.*#(.*);", file)
-                    value = f"#{value.group(1)}"
-            except FileNotFoundError:
-                value = self.highlight_color
-            except AttributeError:
-                value = self.highlight_color
-        self._current_color = value
+            value = get_highlight_color(self.highlight_color)
+        self._current_color = value.upper()
         self.set_preview_colors(self._current_color)
         # ??? and (re-)change btn theme color
         if self.color_button:
@@ -672,9 +469,8 @@ class LayoutBox(Gtk.Box):
             state = Opacity.TOP
             self.layout = name
             print("active layout:", self.layout)
-            button.image.set_from_file(f"{temp_dir}/{self.layout}preview_selected.svg")
-        else:
-            button.image.set_from_file(f"{temp_dir}/{self.layout}preview.svg")
+        if name in self.preview_surfaces:
+            button.image.set_from_surface(self.preview_surfaces[name][button.get_active()])
         button.image.set_opacity(state)  # change img opacity from state
 
     def on_over_img(self, box, event, is_over_image):
@@ -686,23 +482,37 @@ class LayoutBox(Gtk.Box):
         else:
             box.btn.image.set_opacity(Opacity.LOW)
 
+    def on_color_changed(self, chooser, gparam):
+        """ live preview: keep last color, render at most one time by frame """
+        self.pending_color = rgba_to_hex(chooser.get_rgba())
+        if not self.preview_source_id:
+            self.preview_source_id = GLib.timeout_add(PREVIEW_DELAY, self.on_preview_timeout)
+
+    def on_preview_timeout(self):
+        """ show pending color only on active preview, from renderer cache """
+        self.preview_source_id = None
+        img = self.previews.get(self.layout)
+        if img and self.pending_color and self.pending_color != self._current_color:
+            img.set_from_surface(self.preview_surface(self.layout, self.pending_color, self.get_scale_factor(), False))
+        return GLib.SOURCE_REMOVE
+
     def on_color_chosen(self, user_data):
         """ after chose a theme color """
-        col = self.color_button.get_rgba().to_string()[4:-1:]
-        # convert color to hexadecimal
-        col = col.split(",")
-        col = (int(x) for x in col)
-        col = "#%02x%02x%02x" % tuple(col)
+        if self.preview_source_id:
+            GLib.source_remove(self.preview_source_id)
+            self.preview_source_id = None
+        col = rgba_to_hex(self.color_button.get_rgba())
+        if col == self._current_color:
+            # only restore active preview after a live preview
+            if self.layout in self.preview_surfaces:
+                self.previews[self.layout].set_from_surface(self.preview_surfaces[self.layout][True])
+            return
         set_highlight_color(col)
         self.current_color = col
 
     def on_desk_activated(self, switch, gparam):
-        if switch.get_active():
-            state = "on"
-            subprocess.run("gnome-extensions enable gtk4-ding@smedius.gitlab.com", shell=True)
-        else:
-            state = "off"
-            subprocess.run("gnome-extensions disable gtk4-ding@smedius.gitlab.com", shell=True)
+        get_extension_manager().set_enabled("gtk4-ding@smedius.gitlab.com", switch.get_active())
+        state = "on" if switch.get_active() else "off"
         print("Desktop icons was turned", state)
 
     def on_ff_activated(self, switch, gparam):
@@ -715,25 +525,20 @@ class LayoutBox(Gtk.Box):
         print("firefox them was turned", state)
 
     def on_tray_activated(self, switch, gparam):
-        if switch.get_active():
-            state = "on"
-            subprocess.run("gnome-extensions enable appindicatorsupport@rgcjonas.gmail.com", shell=True)
-        else:
-            state = "off"
-            subprocess.run("gnome-extensions disable appindicatorsupport@rgcjonas.gmail.com", shell=True)
+        get_extension_manager().set_enabled("appindicatorsupport@rgcjonas.gmail.com", switch.get_active())
+        state = "on" if switch.get_active() else "off"
         print("System tray was turned", state)
 
     def on_wayland_activated(self, switch, gparam):
-        # Toggle state
-        toggle_wayland()
-        # Disconnect the switch
-        switch.disconnect(self.wayland_handler_id)
-        if get_wayland_state():
-            print("Wayland is on")
-            switch.set_active(True)
-        else:
-            print("Wayland is off")
-            switch.set_active(False)
+        # helper returns the new state, None if not changed
+        state = set_wayland_state(switch.get_active())
+        if state is not None:
+            self.wayland_active = state
+        # Block the handler while the switch follows the real state
+        switch.handler_block(self.wayland_handler_id)
+        print("Wayland is on" if self.wayland_active else "Wayland is off")
+        switch.set_active(self.wayland_active)
+        switch.handler_unblock(self.wayland_handler_id)
 
     # ------------- branding -------------------------------------------
     def on_branding_activated(self, switch, gparam):
@@ -800,45 +605,65 @@ class LayoutBox(Gtk.Box):
         dialog.destroy()
 
     def on_reload_clicked(self, button):
-        reload_gnome_shell()
+        """ reload extensions of applied layout, restart shell only if needed """
+        with UserConf() as conf:
+            layout = conf.read("layout")
+        reload_gnome_shell(layout)
+
+    def start_task(self, build_steps, on_done):
+        """ run steps in worker, task buttons are disabled until on_done """
+        for button in self.task_buttons:
+            button.set_sensitive(False)
+        self.progress.set_fraction(0)
+        self.progress.set_text("")
+        self.progress.show()
+        self.cancel_button.set_sensitive(True)
+        self.cancel_button.show()
+
+        def finish(good, err, cancelled):
+            self.task = None
+            self.progress.hide()
+            self.cancel_button.hide()
+            for button in self.task_buttons:
+                button.set_sensitive(True)
+            on_done(good, err, cancelled)
+        self.task = self.prober.run_task(build_steps, self.on_task_progress, finish)
+
+    def on_task_progress(self, index: int, count: int, label: str):
+        self.progress.set_fraction(index / count)
+        self.progress.set_text(f"{label} ({index + 1}/{count})")
+
+    def on_cancel_clicked(self, button):
+        if self.task:
+            self.task.cancel()
+            button.set_sensitive(False)
+            self.progress.set_text("Cancelling after this step...")
 
     def on_layoutapply_clicked(self, button):
-        """ apply defaut layout to user """
-        #get_extensions(self.layout)
-        ret = True
-        good = True
-        err = None
-
-        switch_layout = f"apply_{self.layout}()"
-        eval(switch_layout)
-        shell('gsettings set org.gnome.shell disable-user-extensions false')
-        saving = self.layout
-        with UserConf() as conf:
-            old_layout = conf.read("layout", "manjaro")
-            # if old_layout == "material_shell":
-                # reload_gnome_shell()
-
-        if not good:
-            # here we continue commands ... good idea ??
-            ret = False
-        if not ret:
-            self.dialog_error(f"Error for set layout \"{self.layout}\"", err)
-        else:
-            # save only if not one error
-            with UserConf() as conf:
-                self.layout = conf.write({"layout": self.layout})
+        """ apply defaut layout to user, saved in conf by the last step """
+        layout = self.layout
+
+        def on_done(good, err, cancelled):
+            if cancelled:
+                print(err)
+            elif not good:
+                self.dialog_error(f"Error for set layout \"{layout}\"", err)
+            else:
                 print("Layout applied")
-        self.layout = saving
+        self.start_task(lambda: layout_steps(layout), on_done)
+
+    def on_undo_clicked(self, button):
+        def on_done(good, err, cancelled):
+            if not good:
+                if not cancelled:
+                    self.dialog_error("Can't undo last layout", err)
+                return
+            with UserConf() as conf:
+                layout = conf.read("layout")
+            if layout in self.previews:
+                self.previews[layout].get_parent().btn.set_active(True)
+        self.start_task(lambda: [("Restoring settings", undo_layout)], on_done)
 
 class Command(Gtk.Box):
-
-    @click.group()
-    def cli():
-        pass
-
-    cli.add_command(apply_traditional)
-    cli.add_command(apply_manjaro)
-    cli.add_command(apply_gnome)
-    cli.add_command(apply_material_shell)
-    cli.add_command(enable_wayland)
-    cli.add_command(disable_wayland)
+    # command line moved in cli.py, without gtk
+    cli = cli
@@ -0,0 +1,185 @@
+import contextlib
+import io
+import re
+import time
+from .extensions import get_extension_manager
+from .hardware import nvidia_present
+from .layouts import load_layouts, plan_layout, apply_layout
+from .settings import SettingsWriter
+from .system import (
+    RootBatch, get_wayland_state, set_highlight_color, plan_packages, packages_result, wayland_result,
+)
+
+try:
+    import tomllib
+except ImportError:  # python < 3.11
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+
+class ManifestError(Exception):
+    pass
+
+
+class Step:
+    """ one action of a manifest, run() return true if ok AND error message """
+
+    def __init__(self, name: str, detail, action):
+        self.name = name
+        self.detail = detail
+        self.action = action
+
+    def run(self) -> dict:
+        output = io.StringIO()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(output):
+                ok, error = self.action()
+        except Exception as err:
+            ok, error = False, str(err)
+        return {
+            "step": self.name,
+            "detail": self.detail,
+            "ok": ok,
+            "seconds": round(time.perf_counter() - start, 6),
+            "error": error or None,
+            "output": output.getvalue().splitlines(),
+        }
+
+
+def read_manifest(file_name) -> dict:
+    """
+    read manifest, as:
+
+        layout = "traditional"
+        branding = true
+        packages = ["gnome-shell-extension-gsconnect"]
+        wayland = true
+        highlight-color = "#16a085"
+
+        [extensions]
+        "appindicatorsupport@rgcjonas.gmail.com" = true
+    """
+
+    if not tomllib:
+        raise ManifestError("reading a manifest needs python >= 3.11 or the \"tomli\" module")
+    try:
+        with open(file_name, "rb") as fread:
+            manifest = tomllib.load(fread)
+    except (OSError, tomllib.TOMLDecodeError) as err:
+        raise ManifestError(f"Can't read manifest {file_name}: {err}")
+    unknown = set(manifest) - {"layout", "branding", "packages", "extensions", "wayland", "highlight-color"}
+    if unknown:
+        raise ManifestError(f"Unknown manifest keys: {', '.join(sorted(unknown))}")
+    return manifest
+
+
+def apply_planned_layout(plan, writer, fresh: bool):
+    """
+    action of layout step
+
+    after a packages step, the plan is made again with a new writer:
+    schemas of new extensions were not installed when the plan was made
+    """
+
+    if fresh:
+        return lambda: apply_layout(plan.layout.id, plan, writer)
+    return lambda: apply_layout(plan.layout.id)
+
+
+def plan_manifest(manifest: dict) -> list:
+    """ list of steps, state is read but nothing is changed """
+    steps = []
+
+    layouts = load_layouts()
+    if "layout" in manifest and not isinstance(manifest["layout"], str):
+        raise ManifestError("layout must be a layout name")
+    if "layout" in manifest and manifest["layout"] not in layouts:
+        raise ManifestError(f"Unknown layout \"{manifest['layout']}\", use one of: {', '.join(layouts)}")
+    extra = manifest.get("packages", [])
+    if not isinstance(extra, list) or not all(isinstance(name, str) for name in extra):
+        raise ManifestError("packages must be a list of package names")
+    branding = manifest.get("branding")
+    if branding is not None and not isinstance(branding, bool):
+        raise ManifestError("branding must be true or false")
+    extensions = manifest.get("extensions", {})
+    if not isinstance(extensions, dict) or not all(isinstance(active, bool) for active in extensions.values()):
+        raise ManifestError("extensions must be a table of uuid = true or false")
+    if "wayland" in manifest and not isinstance(manifest["wayland"], bool):
+        raise ManifestError("wayland must be true or false")
+
+    # packages and wayland behind one authorization, run by the first of these steps
+    batch = RootBatch()
+
+    # all packages in one transaction, before the layout needs them
+    packages = plan_packages(manifest.get("layout", ""), branding, extra)
+    if not packages.is_empty():
+        packages.queue(batch.helper)
+        steps.append(Step("packages", {"install": packages.install, "remove": packages.remove},
+                          lambda: packages_result(packages, batch.run())))
+
+    if "layout" in manifest:
+        writer = SettingsWriter()
+        plan = plan_layout(layouts[manifest["layout"]], writer)
+        steps.append(Step("layout", {
+            "layout": plan.layout.id,
+            "keys": [f"{schema} {key} {value}" for schema, key, value in plan.keys],
+            "enable": plan.enable,
+            "disable": plan.disable,
+            "problems": plan.problems,
+            "skipped": [f"{schema} {key}" for schema, key, _ in plan.skipped],
+        }, apply_planned_layout(plan, writer, packages.is_empty())))
+
+    if extensions:
+        enable = [uuid for uuid, active in extensions.items() if active]
+        disable = [uuid for uuid, active in extensions.items() if not active]
+        _, _, to_enable, to_disable = get_extension_manager().plan(enable, disable)
+
+        def switch_extensions():
+            writer = SettingsWriter()
+            get_extension_manager().apply(enable, disable, writer)
+            return not writer.errors, "\n".join(writer.errors)
+        steps.append(Step("extensions", {
+            "enable": to_enable,
+            "disable": to_disable,
+            "problems": get_extension_manager().check(to_enable),
+        }, switch_extensions))
+
+    if "wayland" in manifest:
+        wanted = manifest["wayland"]
+        if wanted and nvidia_present():
+            reason = "Wayland is not available with an NVIDIA GPU"
+            steps.append(Step("wayland", {"enable": wanted, "skipped": reason}, lambda: (False, reason)))
+        elif wanted != get_wayland_state():
+            batch.helper.set_wayland(wanted)
+
+            def switch_wayland():
+                state = wayland_result(batch.run())
+                if state is None:
+                    return False, "Can't change /etc/gdm/custom.conf"
+                if state != wanted:
+                    return False, f"Wayland is still {'enabled' if state else 'disabled'}"
+                return True, ""
+            steps.append(Step("wayland", {"enable": wanted}, switch_wayland))
+        else:
+            steps.append(Step("wayland", {"enable": wanted, "unchanged": True}, lambda: (True, "")))
+
+    if "highlight-color" in manifest:
+        color = manifest["highlight-color"]
+        if not re.match("^#[0-9a-fA-F]{6}$", str(color)):
+            raise ManifestError(f"highlight-color must be as \"#16a085\", not \"{color}\"")
+
+        def write_color():
+            set_highlight_color(color)
+            return True, ""
+        steps.append(Step("highlight-color", {"color": color}, write_color))
+
+    return steps
+
+
+def run_steps(steps: list) -> dict:
+    """ run all steps, even after an error """
+    results = [step.run() for step in steps]
+    return {"ok": all(result["ok"] for result in results), "steps": results}
@@ -0,0 +1,117 @@
+import os
+from pathlib import Path
+from .privileged import PrivilegedHelper
+
+PACMAN_LOCAL_DB = Path("/var/lib/pacman/local")
+
+
+class PackageIndex:
+    """
+    installed packages read from pacman local database
+
+    each package is a directory "<name>-<pkgver>-<pkgrel>" in local db,
+    the set of names is read again only when the db directory changes
+    """
+
+    def __init__(self, db_path: Path = PACMAN_LOCAL_DB):
+        self.db_path = Path(db_path)
+        self._installed = None
+        self._token = None
+
+    def token(self):
+        try:
+            return self.db_path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def installed(self) -> set:
+        """ names of all installed packages """
+        token = self.token()
+        if self._installed is None or token != self._token:
+            installed = set()
+            try:
+                for entry in os.scandir(self.db_path):
+                    if entry.is_dir():
+                        installed.add(entry.name.rsplit("-", 2)[0])
+            except OSError as err:
+                print(f"Can't read pacman database: {err}")
+            self._installed = installed
+            self._token = token
+        return self._installed
+
+    def is_installed(self, name: str) -> bool:
+        return name in self.installed()
+
+    def missing(self, names) -> list:
+        """ packages not installed, in given order """
+        installed = self.installed()
+        return [name for name in names if name not in installed]
+
+
+package_index = PackageIndex()
+
+
+class PackagePlan:
+    """
+    packages to install and to remove, deduplicated
+
+    each list is one pacman transaction in the root helper, so the database is synced
+    and dependencies are resolved one time
+    """
+
+    def __init__(self, index: PackageIndex = package_index):
+        self.index = index
+        self.install = []
+        self.remove = []
+        self.wanted = set()  # asked to install, installed or not
+
+    def add_install(self, names):
+        """ add packages not installed, wins over a remove """
+        names = list(names)
+        self.wanted.update(names)
+        self.remove = [name for name in self.remove if name not in self.wanted]
+        for name in self.index.missing(names):
+            if name not in self.install:
+                self.install.append(name)
+
+    def add_remove(self, names):
+        """ add installed packages, not if already asked to install """
+        for name in names:
+            if self.index.is_installed(name) and name not in self.wanted and name not in self.remove:
+                self.remove.append(name)
+
+    def is_empty(self) -> bool:
+        return not (self.install or self.remove)
+
+    def queue(self, helper: PrivilegedHelper) -> PrivilegedHelper:
+        """ add one install and one remove operation to a root helper batch """
+        if self.install:
+            helper.install(self.install)
+        if self.remove:
+            helper.remove(self.remove)
+        return helper
+
+    def results(self, report: dict) -> dict:
+        """
+        state of each package after the batch, read again from database
+
+        Args:
+            report (dict): report of the helper batch with our operations
+
+        Returns:
+            dict: package -> {"action": "install" or "remove", "ok": bool}
+        """
+
+        if report.get("error"):
+            print(f"Package transaction failed: {report['error']}")
+        for result in report.get("results", []):
+            if result["op"] in ("install", "remove") and result["error"]:
+                print(f"Package transaction failed: {result['error']}")
+        installed = self.index.installed()
+        results = {name: {"action": "install", "ok": name in installed} for name in self.install}
+        results.update({name: {"action": "remove", "ok": name not in installed} for name in self.remove})
+        return results
+
+    def run(self, helper: PrivilegedHelper = None) -> dict:
+        """ run transactions behind one authorization, see results() """
+        return self.results(self.queue(helper or PrivilegedHelper()).run())
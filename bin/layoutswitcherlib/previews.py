@@ -0,0 +1,166 @@
+import gi
+
+gi.require_version("GdkPixbuf", "2.0")
+from gi.repository import GdkPixbuf, GLib
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from .state import CACHE_DIR
+from .trace import tracer
+
+# color used in data/pictures/*preview.svg, replaced by theme colors
+TEMPLATE_COLOR = "#16a085"
+MAX_CACHE_BYTES = 4 * 1024 * 1024
+
+
+class ThumbnailCache:
+    """
+    rendered previews saved as PNG between launches
+
+    file name is made of the SVG template hash, the color and the scale,
+    so a new template (package upgrade) never uses old files; these are removed
+    when the cache is over its size
+    """
+
+    def __init__(self, directory: Path = CACHE_DIR / "previews", max_bytes: int = MAX_CACHE_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def path(self, digest: str, color: str, scale: int) -> Path:
+        return self.directory / f"{digest}-{color.lstrip('#').lower()}-{scale}.png"
+
+    def load(self, digest: str, color: str, scale: int):
+        """ pixbuf from cache, None if not found """
+        try:
+            return GdkPixbuf.Pixbuf.new_from_file(str(self.path(digest, color, scale)))
+        except GLib.Error:
+            return None
+
+    def save(self, digest: str, color: str, scale: int, pixbuf: GdkPixbuf.Pixbuf, keep=()):
+        """
+        atomic write, then remove oldest files over max_bytes
+
+        Args:
+            keep (list): digests of current templates, files of other templates are removed first
+        """
+
+        file_name = self.path(digest, color, scale)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_file = file_name.with_suffix(".tmp")
+            pixbuf.savev(str(tmp_file), "png", [], [])
+            os.replace(tmp_file, file_name)
+        except (OSError, GLib.Error) as err:
+            print(f"Can't save preview {file_name.name}: {err}")
+            return
+        self.prune(keep)
+
+    def prune(self, keep=()):
+        try:
+            entries = [(entry, entry.stat()) for entry in os.scandir(self.directory) if entry.name.endswith(".png")]
+        except OSError:
+            return
+        # old templates first, then least recently written
+        entries.sort(key=lambda item: (item[0].name.split("-")[0] in keep, item[1].st_mtime_ns))
+        total = sum(stat.st_size for _, stat in entries)
+        for entry, stat in entries:
+            if total <= self.max_bytes and (not keep or entry.name.split("-")[0] in keep):
+                break
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                continue
+            total -= stat.st_size
+
+
+class PreviewRenderer:
+    """
+    recolor preview SVGs in memory and keep the decoded pixbufs
+
+    templates are read one time, pixbufs are cached by (layout, color, scale)
+    and the least recently used ones are dropped.
+    With a ThumbnailCache, a preview already rendered in a previous launch is loaded from PNG
+    """
+
+    def __init__(self, templates: dict, max_size: int = 32, thumbnails: ThumbnailCache = None):
+        """
+        initialize object
+
+        Args:
+            templates (dict): layout id -> SVG file
+            max_size (int): max pixbufs in cache
+            thumbnails (ThumbnailCache): PNG cache on disk, optional
+        """
+
+        self.files = {key: Path(file_name) for key, file_name in templates.items()}
+        self.templates = {}  # layout id -> SVG bytes
+        self.digests = {}  # layout id -> SVG hash
+        self.cache = OrderedDict()
+        self.max_size = max_size
+        self.thumbnails = thumbnails
+        self.unsaved = set()  # keys in cache, rendered but not written in thumbnails
+
+    def template(self, layout_id: str) -> bytes:
+        if layout_id not in self.templates:
+            self.templates[layout_id] = self.files[layout_id].read_bytes()
+            self.digests[layout_id] = hashlib.sha1(self.templates[layout_id]).hexdigest()[:16]
+        return self.templates[layout_id]
+
+    def digest(self, layout_id: str) -> str:
+        self.template(layout_id)
+        return self.digests[layout_id]
+
+    def render(self, layout_id: str, color: str, scale: int = 1, persist: bool = True) -> GdkPixbuf.Pixbuf:
+        """
+        pixbuf of layout preview with color in place of TEMPLATE_COLOR
+
+        Args:
+            layout_id (str): layout
+            color (str): as "#ff0000"
+            scale (int): widget scale factor, for HiDPI screens
+            persist (bool): write in thumbnails, false for colors only shown in live preview
+        """
+
+        key = (layout_id, color.lower(), scale)
+        pixbuf = self.cache.get(key)
+        if pixbuf:
+            self.cache.move_to_end(key)
+            if persist and key in self.unsaved:
+                self.save(key, pixbuf)
+            return pixbuf
+
+        pixbuf = None
+        if self.thumbnails:
+            with tracer.span(f"load {layout_id}", "render", color=color, scale=scale):
+                pixbuf = self.thumbnails.load(self.digest(layout_id), color, scale)
+        if not pixbuf:
+            svg = self.template(layout_id).replace(TEMPLATE_COLOR.encode(), color.encode())
+            with tracer.span(f"render {layout_id}", "render", color=color, scale=scale):
+                pixbuf = self.decode(svg, scale)
+            if persist:
+                self.save(key, pixbuf)
+            else:
+                self.unsaved.add(key)
+        self.cache[key] = pixbuf
+        if len(self.cache) > self.max_size:
+            self.unsaved.discard(self.cache.popitem(last=False)[0])
+        return pixbuf
+
+    def save(self, key: tuple, pixbuf: GdkPixbuf.Pixbuf):
+        """ write (layout id, color, scale) pixbuf in thumbnails """
+        self.unsaved.discard(key)
+        if self.thumbnails:
+            layout_id, color, scale = key
+            keep = [self.digest(layout) for layout in self.files]
+            self.thumbnails.save(self.digest(layout_id), color, scale, pixbuf, keep)
+
+    @staticmethod
+    def decode(svg: bytes, scale: int = 1) -> GdkPixbuf.Pixbuf:
+        """ rasterize SVG from memory """
+        loader = GdkPixbuf.PixbufLoader.new_with_mime_type("image/svg+xml")
+        if scale != 1:
+            loader.connect("size-prepared", lambda obj, width, height: obj.set_size(width * scale, height * scale))
+        loader.write(svg)
+        loader.close()
+        return loader.get_pixbuf()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+root helper: run a batch of typed operations behind one pkexec authorization
+
+only python standard library, the file is run as a script by pkexec:
+
+    echo '[{"op": "set-wayland", "enabled": true}]' | pkexec /usr/bin/python3 privileged.py
+
+operations:
+    {"op": "set-wayland", "enabled": bool}
+    {"op": "install", "packages": [str]}
+    {"op": "remove", "packages": [str]}
+
+Output is JSON: {"ok": bool, "results": [{"op", "ok", "error", "state"}]},
+"state" is the new state, so caller has no need to probe again.
+"--root DIR" (for tests) is refused when running as root.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+GDM_CONF = "etc/gdm/custom.conf"
+PACKAGE_NAME = re.compile(r"^[a-z0-9@_+][a-z0-9@._+-]*$")
+
+
+def read_wayland(root: Path) -> bool:
+    """ true if not disabled in gdm custom.conf """
+    try:
+        lines = (root / GDM_CONF).read_text().splitlines()
+    except FileNotFoundError:
+        return True
+    return not any(line.replace(" ", "") == "WaylandEnable=false" for line in lines)
+
+
+def set_wayland(root: Path, enabled: bool) -> dict:
+    """ comment or uncomment WaylandEnable=false in [daemon] section """
+    conf = root / GDM_CONF
+    try:
+        lines = conf.read_text().splitlines()
+    except FileNotFoundError:
+        lines = ["[daemon]"]
+    found = False
+    for index, line in enumerate(lines):
+        key = line.lstrip("#").replace(" ", "")
+        if key.startswith("WaylandEnable="):
+            lines[index] = "#WaylandEnable=false" if enabled else "WaylandEnable=false"
+            found = True
+    if not found and not enabled:
+        if "[daemon]" not in lines:
+            lines.append("[daemon]")
+        lines.insert(lines.index("[daemon]") + 1, "WaylandEnable=false")
+    conf.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = conf.with_suffix(".tmp")
+    tmp_file.write_text("\n".join(lines) + "\n")
+    os.replace(tmp_file, conf)
+    return {"wayland": read_wayland(root)}
+
+
+def installed(root: Path, packages: list) -> dict:
+    """ package -> true if installed, one pacman call """
+    process = subprocess.run(["pacman", "--root", str(root), "-Qq"] + packages, capture_output=True, text=True)
+    found = set(process.stdout.split())
+    return {package: package in found for package in packages}
+
+
+def change_packages(root: Path, packages: list, install: bool) -> tuple:
+    """ one pacman transaction, return new state AND error message """
+    bad = [package for package in packages if not PACKAGE_NAME.match(package)]
+    if bad:
+        raise ValueError(f"invalid package names: {', '.join(bad)}")
+    if install:
+        command = ["pacman", "--root", str(root), "-S", "--needed", "--noconfirm"]
+    else:
+        command = ["pacman", "--root", str(root), "-R", "--noconfirm"]
+    process = subprocess.run(command + packages, capture_output=True, text=True)
+    error = ""
+    if process.returncode != 0:
+        error = process.stderr.strip() or f"pacman exit {process.returncode}"
+    return {"packages": installed(root, packages)}, error
+
+
+def run_operation(root: Path, operation: dict) -> dict:
+    """ one typed operation, never raise """
+    name = operation.get("op")
+    result = {"op": name, "ok": True, "error": None, "state": None}
+    try:
+        if name == "set-wayland":
+            if not isinstance(operation.get("enabled"), bool):
+                raise ValueError("\"enabled\" must be a boolean")
+            result["state"] = set_wayland(root, operation["enabled"])
+        elif name in ("install", "remove"):
+            packages = operation.get("packages")
+            if not packages or not isinstance(packages, list) or not all(isinstance(p, str) for p in packages):
+                raise ValueError("\"packages\" must be a list of names")
+            result["state"], error = change_packages(root, packages, name == "install")
+            if error:
+                result.update({"ok": False, "error": error})
+        else:
+            raise ValueError(f"unknown operation \"{name}\"")
+    except (OSError, ValueError) as err:
+        result.update({"ok": False, "error": str(err)})
+    return result
+
+
+class PrivilegedHelper:
+    """
+    client: queue operations, run them in one helper process
+
+    Args:
+        elevate (list): command prefix, pkexec. Empty for tests
+        root (Path): root directory for tests, helper must not run as root
+    """
+
+    def __init__(self, elevate=("pkexec",), root=None):
+        self.elevate = list(elevate)
+        self.root = root
+        self.operations = []
+
+    def set_wayland(self, enabled: bool):
+        self.operations.append({"op": "set-wayland", "enabled": bool(enabled)})
+        return self
+
+    def install(self, packages):
+        self.operations.append({"op": "install", "packages": list(packages)})
+        return self
+
+    def remove(self, packages):
+        self.operations.append({"op": "remove", "packages": list(packages)})
+        return self
+
+    def run(self) -> dict:
+        """
+        run queued operations behind one authorization
+
+        Returns:
+            dict: helper report, {"ok": false, "error": } if helper did not run
+        """
+
+        operations, self.operations = self.operations, []
+        if not operations:
+            return {"ok": True, "results": []}
+        command = self.elevate + [sys.executable, str(Path(__file__).resolve())]
+        if self.root:
+            command += ["--root", str(self.root)]
+        try:
+            process = subprocess.run(command, input=json.dumps(operations), capture_output=True, text=True)
+            return json.loads(process.stdout)
+        except FileNotFoundError as err:
+            return {"ok": False, "error": str(err), "results": []}
+        except ValueError:
+            # pkexec exit 126: authorization refused
+            error = process.stderr.strip() or f"helper exit {process.returncode}"
+            return {"ok": False, "error": error, "results": []}
+
+
+def main(argv: list) -> int:
+    root = Path("/")
+    if len(argv) == 2 and argv[0] == "--root":
+        if os.geteuid() == 0:
+            print("--root is only for tests, not as root", file=sys.stderr)
+            return 2
+        root = Path(argv[1])
+    elif argv:
+        print("usage: privileged.py [--root DIR] < operations.json", file=sys.stderr)
+        return 2
+    try:
+        operations = json.load(sys.stdin)
+        if not isinstance(operations, list):
+            raise ValueError("operations must be a list")
+    except ValueError as err:
+        print(json.dumps({"ok": False, "error": str(err), "results": []}))
+        return 2
+    results = [run_operation(root, operation) for operation in operations]
+    print(json.dumps({"ok": all(result["ok"] for result in results), "results": results}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,105 @@
+import gi
+
+gi.require_version("GLib", "2.0")
+from gi.repository import GLib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .trace import tracer
+
+
+class Prober:
+    """
+    run blocking state probes in worker threads
+
+    results are given to callbacks in the GTK main loop, so a callback can update widgets
+    """
+
+    def __init__(self, max_workers: int = 6):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="probe")
+
+    def run(self, probe, callback, *args):
+        """
+        start a probe now, call later callback(result, *args) in main loop
+
+        Args:
+            probe (callable): function without argument, run in a thread
+            callback (callable): receive probe result, or None if probe failed
+        """
+
+        future = self.executor.submit(self._traced, probe)
+        future.add_done_callback(lambda done: GLib.idle_add(self._finish, probe, done, callback, args))
+        return future
+
+    @staticmethod
+    def _traced(probe):
+        with tracer.span(getattr(probe, "__name__", str(probe)), "probe"):
+            return probe()
+
+    @staticmethod
+    def _finish(probe, future, callback, args):
+        try:
+            result = future.result()
+        except Exception as err:
+            print(f"Probe {getattr(probe, '__name__', probe)} failed: {err}")
+            result = None
+        callback(result, *args)
+        return GLib.SOURCE_REMOVE
+
+    def run_task(self, build_steps, on_progress, on_done):
+        """
+        start a Task in a worker thread
+
+        Returns:
+            Task: use task.cancel() to stop it before next step
+        """
+
+        task = Task(build_steps, on_progress, on_done)
+        self.executor.submit(task.run)
+        return task
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class Task:
+    """
+    run steps one after the other in a worker thread
+
+    build_steps() is also run in the worker, it returns a list of (label, step) and
+    step() return true if ok AND error message.
+    In main loop: on_progress(index, count, label) before each step, and at end
+    on_done(ok, error message, cancelled)
+    """
+
+    def __init__(self, build_steps, on_progress, on_done):
+        self.build_steps = build_steps
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """ stop before next step, a running step is not interrupted """
+        self.cancelled.set()
+
+    @staticmethod
+    def _idle(callback, *args):
+        GLib.idle_add(lambda: callback(*args) and False)
+
+    def run(self):
+        try:
+            with tracer.span(getattr(self.build_steps, "__name__", "task"), "task"):
+                steps = self.build_steps()
+            for index, (label, step) in enumerate(steps):
+                if self.cancelled.is_set():
+                    self._idle(self.on_done, False, f"Cancelled before: {label}", True)
+                    return
+                self._idle(self.on_progress, index, len(steps), label)
+                with tracer.span(label, "task"):
+                    good, err = step()
+                if not good:
+                    self._idle(self.on_done, False, err, False)
+                    return
+        except Exception as err:
+            self._idle(self.on_done, False, str(err), False)
+            return
+        self._idle(self.on_done, True, "", False)
@@ -0,0 +1,167 @@
+import gi
+
+gi.require_version("Gio", "2.0")
+from gi.repository import Gio, GLib
+from .inventory import extension_inventory
+from .trace import tracer
+
+
+def find_schema(schema_id: str):
+    """
+    find a schema in default source or in extensions "schemas/" directories
+
+    Extensions ship their own compiled schemas, not installed in the default source,
+    the extension declaring the schema in its metadata is tried first
+
+    Args:
+        schema_id (str): as "org.gnome.shell.extensions.dash-to-panel"
+
+    Returns:
+        Gio.SettingsSchema or None
+    """
+
+    default = Gio.SettingsSchemaSource.get_default()
+    schema = default.lookup(schema_id, True) if default else None
+    if schema:
+        return schema
+    extensions = sorted(extension_inventory.extensions().values(), key=lambda ext: ext.settings_schema != schema_id)
+    for extension in extensions:
+        schemas_dir = extension.path / "schemas"
+        if not (schemas_dir / "gschemas.compiled").exists():
+            continue
+        try:
+            source = Gio.SettingsSchemaSource.new_from_directory(str(schemas_dir), default, False)
+        except GLib.Error:
+            continue
+        schema = source.lookup(schema_id, False)
+        if schema:
+            return schema
+    return None
+
+
+def to_variant(value_type: GLib.VariantType, value) -> GLib.Variant:
+    """
+    convert a value to a GVariant of the key type
+
+    str values are GVariant text as for the gsettings command line;
+    a string key also accepts raw text (BOTTOM, :minimize,maximize,close)
+    """
+
+    if isinstance(value, GLib.Variant):
+        return value
+    type_string = value_type.dup_string()
+    if not isinstance(value, str):
+        return GLib.Variant(type_string, value)
+    try:
+        return GLib.Variant.parse(value_type, value, None, None)
+    except GLib.Error:
+        if type_string == "s":
+            return GLib.Variant("s", value)
+        raise
+
+
+class SettingsWriter:
+    """
+    write gsettings keys in-process, in one delayed-apply transaction
+
+    with SettingsWriter() as writer:
+        writer.set("org.gnome.desktop.wm.preferences", "button-layout", ":minimize,maximize,close")
+    """
+
+    def __init__(self):
+        self.settings = {}  # schema id -> Gio.Settings in delay mode
+        self.errors = []
+
+    def __enter__(self) -> object:
+        return self
+
+    def __exit__(self, etype, evalue, traceback) -> None:
+        if etype is None:
+            self.apply()
+        else:
+            self.revert()
+
+    def get_settings(self, schema_id: str):
+        """ return Gio.Settings in delay mode, None if schema not installed """
+        if schema_id not in self.settings:
+            schema = find_schema(schema_id)
+            settings = None
+            if schema:
+                settings = Gio.Settings.new_full(schema, None, None)
+                settings.delay()
+            self.settings[schema_id] = settings
+        return self.settings[schema_id]
+
+    def set(self, schema_id: str, key: str, value) -> bool:
+        """
+        stage a new value, written only by apply()
+
+        Args:
+            schema_id (str): gsettings schema
+            key (str): key in schema
+            value: GLib.Variant, python value or GVariant text
+
+        Returns:
+            bool: False if schema/key not exists or value not valid
+        """
+
+        settings = self.get_settings(schema_id)
+        if not settings:
+            self.errors.append(f"No such schema \"{schema_id}\"")
+            return False
+        schema = settings.props.settings_schema
+        if not schema.has_key(key):
+            self.errors.append(f"No such key \"{key}\" in schema \"{schema_id}\"")
+            return False
+        schema_key = schema.get_key(key)
+        try:
+            variant = to_variant(schema_key.get_value_type(), value)
+        except (GLib.Error, TypeError, ValueError) as err:
+            self.errors.append(f"{schema_id} {key}: {err}")
+            return False
+        if not schema_key.range_check(variant):
+            self.errors.append(f"{schema_id} {key}: value {value} out of range")
+            return False
+        return settings.set_value(key, variant)
+
+    def missing(self, schema_id: str, key: str) -> str:
+        """ reason the key can't be written (schema or key not installed), "" if it exists """
+        settings = self.get_settings(schema_id)
+        if not settings:
+            return f"No such schema \"{schema_id}\""
+        if not settings.props.settings_schema.has_key(key):
+            return f"No such key \"{key}\" in schema \"{schema_id}\""
+        return ""
+
+    def get_value(self, schema_id: str, key: str):
+        """ current value as GLib.Variant, None if schema/key not exists """
+        settings = self.get_settings(schema_id)
+        if not settings or not settings.props.settings_schema.has_key(key):
+            return None
+        return settings.get_value(key)
+
+    def differs(self, schema_id: str, key: str, value) -> bool:
+        """ True if value is not the current one (or can't be compared) """
+        current = self.get_value(schema_id, key)
+        if current is None:
+            return True
+        try:
+            return not current.equal(to_variant(current.get_type(), value))
+        except (GLib.Error, TypeError, ValueError):
+            return True
+
+    @tracer.traced("settings", "SettingsWriter.apply")
+    def apply(self):
+        """ write all staged keys and wait for dconf """
+        for settings in self.settings.values():
+            if settings and settings.get_has_unapplied():
+                settings.apply()
+        Gio.Settings.sync()
+        for error in self.errors:
+            print(error)
+        return not self.errors
+
+    def revert(self):
+        for settings in self.settings.values():
+            if settings:
+                settings.revert()
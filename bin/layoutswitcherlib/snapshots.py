@@ -0,0 +1,209 @@
+import json
+import os
+import subprocess
+import time
+import zlib
+import gi
+from pathlib import Path
+
+gi.require_version("Gio", "2.0")
+from gi.repository import Gio
+from .settings import find_schema
+
+DATA_DIR = Path("~/.local/share/gnome-layout-switcher").expanduser()
+MAX_SNAPSHOTS = 20
+
+# dconf subtrees changed by layouts and user tweaks
+SNAPSHOT_DIRS = (
+    "org/gnome/shell/extensions/dash-to-panel",
+    "org/gnome/shell/extensions/arcmenu",
+    "org/gnome/shell/extensions/dash-to-dock",
+    "org/gnome/desktop/wm/preferences",
+)
+# only these keys in other dconf directories
+SNAPSHOT_KEYS = {
+    "org/gnome/shell": ("enabled-extensions", "disabled-extensions"),
+}
+
+
+def parse_keyfile(text: str) -> dict:
+    """
+    parse "dconf dump /" output
+
+    Returns:
+        dict: path -> {key: GVariant text}
+    """
+
+    sections = {}
+    keys = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            keys = sections.setdefault(line[1:-1].strip("/"), {})
+        elif keys is not None and "=" in line:
+            key, value = line.split("=", 1)
+            keys[key] = value
+    return sections
+
+
+def format_keyfile(sections: dict) -> str:
+    """ keyfile for "dconf load /" """
+    lines = []
+    for path, keys in sections.items():
+        lines.append(f"[{path}]")
+        lines += [f"{key}={value}" for key, value in keys.items()]
+        lines.append("")
+    return "\n".join(lines)
+
+
+def snapshot_sections(sections: dict) -> dict:
+    """ keep only snapshot subtrees and keys """
+    kept = {}
+    for path, keys in sections.items():
+        if any(path == root or path.startswith(root + "/") for root in SNAPSHOT_DIRS):
+            kept[path] = dict(keys)
+        elif path in SNAPSHOT_KEYS:
+            wanted = {key: value for key, value in keys.items() if key in SNAPSHOT_KEYS[path]}
+            if wanted:
+                kept[path] = wanted
+    return kept
+
+
+def set_since(sections: dict, extensions: bool = True) -> dict:
+    """
+    keys of snapshot paths set now but not in sections, with their default value
+
+    read in-process from the schemas, written back by the same "dconf load" as the snapshot
+
+    Args:
+        sections (dict): snapshot, path -> {key: GVariant text}
+        extensions (bool): include lists of SNAPSHOT_KEYS
+
+    Returns:
+        dict: path -> {key: default GVariant text}
+    """
+
+    paths = set(SNAPSHOT_DIRS) | {path for path in sections if path not in SNAPSHOT_KEYS}
+    if extensions:
+        paths |= set(SNAPSHOT_KEYS)
+    defaults = {}
+    for path in sorted(paths):
+        schema = find_schema(path.replace("/", "."))
+        if not schema:
+            continue
+        settings = Gio.Settings.new_full(schema, None, None if schema.get_path() else f"/{path}/")
+        for key in SNAPSHOT_KEYS.get(path, schema.list_keys()):
+            if key in sections.get(path, {}) or not schema.has_key(key) or settings.get_user_value(key) is None:
+                continue
+            defaults.setdefault(path, {})[key] = schema.get_key(key).get_default_value().print_(True)
+    return defaults
+
+
+def dconf_dump() -> dict:
+    """ snapshot subtrees of user database, one "dconf dump" """
+    process = subprocess.run(["dconf", "dump", "/"], capture_output=True, text=True, check=True)
+    return snapshot_sections(parse_keyfile(process.stdout))
+
+
+class SnapshotStore:
+    """
+    dconf snapshots taken when leaving a layout
+
+    saved as compressed JSON, only the last max_size snapshots are kept
+    """
+
+    def __init__(self, file_name: Path = DATA_DIR / "snapshots.json.z", max_size: int = MAX_SNAPSHOTS):
+        self.file_name = Path(file_name)
+        self.max_size = max_size
+        self.entries = None  # [{"layout": , "time": , "sections": }], last is newest
+
+    def load(self) -> list:
+        if self.entries is None:
+            try:
+                self.entries = json.loads(zlib.decompress(self.file_name.read_bytes()))
+            except (OSError, ValueError, zlib.error):
+                self.entries = []
+        return self.entries
+
+    def save(self):
+        """ atomic write """
+        self.file_name.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.file_name.with_suffix(".tmp")
+        tmp_file.write_bytes(zlib.compress(json.dumps(self.entries, separators=(",", ":")).encode(), 9))
+        os.replace(tmp_file, self.file_name)
+
+    def take(self, layout_id):
+        """
+        save current state of layout_id before leaving it
+
+        Returns:
+            dict: new snapshot, None if dconf can't be read
+        """
+
+        try:
+            sections = dconf_dump()
+        except (OSError, subprocess.CalledProcessError) as err:
+            print(f"Can't take dconf snapshot: {err}")
+            return None
+        entries = self.load()
+        entry = {"layout": layout_id, "time": int(time.time()), "sections": sections}
+        entries.append(entry)
+        del entries[:-self.max_size]
+        self.save()
+        return entry
+
+    def latest(self, layout_id: str):
+        """ last snapshot taken when leaving layout_id, or None """
+        for entry in reversed(self.load()):
+            if entry["layout"] == layout_id:
+                return entry
+        return None
+
+    def pop(self):
+        """ remove and return newest snapshot, None if history is empty """
+        entries = self.load()
+        if not entries:
+            return None
+        entry = entries.pop()
+        self.save()
+        return entry
+
+    @staticmethod
+    def restore(entry: dict, extensions: bool = True) -> tuple:
+        """
+        write snapshot back with one "dconf load /"
+
+        keys set since the snapshot but not in it are written with their default value in the same load
+
+        Args:
+            entry (dict): snapshot
+            extensions (bool): restore enabled and disabled extensions lists too,
+                false for the tweaks of a layout, extensions enabled since are kept
+
+        Returns:
+            tuple: (true if ok, error message)
+        """
+
+        sections = {path: dict(keys) for path, keys in entry["sections"].items()}
+        if not extensions:
+            for path, keys in SNAPSHOT_KEYS.items():
+                for key in keys:
+                    sections.get(path, {}).pop(key, None)
+                if path in sections and not sections[path]:
+                    del sections[path]
+        for path, keys in set_since(sections, extensions).items():
+            sections.setdefault(path, {}).update(keys)
+        try:
+            subprocess.run(["dconf", "load", "/"], input=format_keyfile(sections),
+                           capture_output=True, text=True, check=True)
+        except FileNotFoundError:
+            return False, "dconf not found"
+        except subprocess.CalledProcessError as err:
+            return False, (err.stderr or "").strip() or str(err)
+        print(f"Restored snapshot of {time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['time']))}")
+        return True, ""
+
+
+snapshot_store = SnapshotStore()
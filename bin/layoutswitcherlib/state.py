@@ -0,0 +1,89 @@
+import json
+import os
+from pathlib import Path
+from .firefox import firefox_profiles
+from .hardware import pci_token
+from .packages import PACMAN_LOCAL_DB
+
+CACHE_DIR = Path("~/.cache/gnome-layout-switcher").expanduser()
+GDM_CONF = Path("/etc/gdm/custom.conf")
+DCONF_USER_DB = Path("~/.config/dconf/user").expanduser()
+
+
+def mtimes(*paths) -> list:
+    tokens = []
+    for path in paths:
+        try:
+            tokens.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            tokens.append(None)
+    return tokens
+
+
+# fact name -> validity token, a few stat() calls
+TOKENS = {
+    "branding": lambda: mtimes(PACMAN_LOCAL_DB),
+    "wayland": lambda: mtimes(GDM_CONF) + [pci_token()],
+    "tray": lambda: mtimes(DCONF_USER_DB),
+    "desktop-icons": lambda: mtimes(DCONF_USER_DB),
+    "firefox-theme": lambda: list(firefox_profiles.token()),
+}
+
+
+class StateCache:
+    """
+    system state saved between launches
+
+    each fact is saved with its token, a fact is valid while its token is the same
+    """
+
+    def __init__(self, file_name: Path = CACHE_DIR / "state.json"):
+        self.file_name = Path(file_name)
+        self.facts = None  # name -> {"token": , "value": }
+        self.modified = False
+
+    def load(self):
+        if self.facts is None:
+            try:
+                self.facts = json.loads(self.file_name.read_text())
+            except (OSError, ValueError):
+                self.facts = {}
+        return self.facts
+
+    @staticmethod
+    def token(name: str) -> list:
+        return TOKENS[name]()
+
+    def get(self, name: str, token: list) -> tuple:
+        """
+        read a fact
+
+        Returns:
+            tuple: (True if fact is valid for token, value)
+        """
+
+        fact = self.load().get(name)
+        if not fact or fact.get("token") != token:
+            return False, None
+        return True, fact.get("value")
+
+    def set(self, name: str, token: list, value):
+        self.load()[name] = {"token": token, "value": value}
+        self.modified = True
+
+    def invalidate(self, name: str):
+        if self.load().pop(name, None) is not None:
+            self.modified = True
+
+    def save(self):
+        """ atomic write, only if modified """
+        if not self.modified:
+            return
+        self.file_name.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.file_name.with_suffix(".tmp")
+        tmp_file.write_text(json.dumps(self.facts))
+        os.replace(tmp_file, self.file_name)
+        self.modified = False
+
+
+state_cache = StateCache()
@@ -0,0 +1,250 @@
+import os
+import re
+import sys
+import gi
+
+gi.require_version("GLib", "2.0")
+gi.require_version("Gio", "2.0")
+from gi.repository import GLib, Gio
+import subprocess
+from pathlib import Path
+from .layouts import load_layouts, data_dir
+from .extensions import get_extension_manager
+from .inventory import extension_inventory
+from .hardware import nvidia_present
+from .firefox import firefox_profiles
+from .packages import package_index, PackagePlan
+from .css import CssDefines
+from .privileged import PrivilegedHelper, read_wayland
+from .state import state_cache
+
+# Define the path to css file
+css_file = Path("~/.config/gtk-3.0/gtk.css").expanduser()
+
+# Define asset in use
+asset = ["manjaro-gdm-branding"]
+
+
+def css_template() -> bytes:
+    """ content of a new user gtk.css """
+    template = data_dir() / "css/gtk.css"
+    if not template.exists():
+        template = Path("/usr/share/gtk-3.0/gtk.css")
+    return template.read_bytes() if template.exists() else b""
+
+
+gtk_css = CssDefines(css_file, css_template)
+
+
+def get_highlight_color(default=None):
+    """ theme_selected_bg_color in user gtk.css, default if not a "#rrggbb" color (as @accent or shade()) """
+    color = gtk_css.get("theme_selected_bg_color", default)
+    if color and re.match("^#[0-9a-fA-F]{6}$", color):
+        return color
+    return default
+
+
+def set_highlight_color(color: str):
+    """ write theme_selected_bg_color in user gtk.css, created from our template if not exists """
+    gtk_css.set("theme_selected_bg_color", color)
+
+
+def get_layouts():
+    return load_layouts().values()
+
+
+def session_type() -> str:
+    """ "wayland", "x11" ... from environment or logind, "" if unknown """
+    session = os.environ.get("XDG_SESSION_TYPE")
+    if session:
+        return session
+    try:
+        bus = Gio.bus_get_sync(Gio.BusType.SYSTEM, None)
+        result = bus.call_sync(
+            "org.freedesktop.login1", "/org/freedesktop/login1/session/auto", "org.freedesktop.DBus.Properties", "Get",
+            GLib.Variant("(ss)", ("org.freedesktop.login1.Session", "Type")), GLib.VariantType("(v)"),
+            Gio.DBusCallFlags.NONE, -1, None)
+    except GLib.Error as err:
+        print(f"Can't read session type: {err.message}")
+        return ""
+    return result.unpack()[0]
+
+
+def restart_gnome_shell():
+    """ last resort: restart shell on x11, logout on wayland """
+    if session_type() == "wayland":
+        GLib.spawn_command_line_sync("gnome-session-quit --logout")
+    else:
+        GLib.spawn_command_line_sync("busctl --user call org.gnome.Shell /org/gnome/Shell org.gnome.Shell Eval s \'Meta.restart(\"Restarting GNOME...\")\'")
+
+
+def reload_gnome_shell(layout_id: str = "") -> bool:
+    """
+    reload only extensions of layout, shell is restarted only if an extension is new on disk
+
+    Returns:
+        bool: true if shell was restarted
+    """
+
+    manager = get_extension_manager()
+    layouts = load_layouts()
+    if layout_id in layouts:
+        enable, disable = layouts[layout_id].required, layouts[layout_id].conflicting
+    else:
+        enable, disable = manager.get_enabled(), []
+    unknown = manager.refresh(enable, disable)
+    if not unknown:
+        print("Extensions reloaded")
+        return False
+    print(f"New extensions, restart needed: {', '.join(unknown)}")
+    restart_gnome_shell()
+    return True
+
+
+def shell(commands) -> tuple:
+    """return true if command return 0 AND error message"""
+    if "--dev" in sys.argv:
+        print("Debug mode on:")
+        print("Simulating shell commands:")
+        print(f"{commands}")
+    else:
+        try:
+            # only run if not in dev mode
+            if isinstance(commands, str):
+                # if is string then we only have one shell command
+                subprocess.run(commands, text=True, shell=True, check=True)
+            else:
+                # is a tuple or list
+                for cmd in commands:
+                    subprocess.run(cmd, text=True, shell=True, check=True)
+        except subprocess.CalledProcessError as err:
+            return False, str(err)
+    return True, ""
+
+class RootBatch:
+    """
+    root operations of several steps, run by the first step that needs them,
+    behind one authorization
+
+    batch = RootBatch()
+    plan.queue(batch.helper)
+    batch.helper.set_wayland(True)
+    packages_result(plan, batch.run()); wayland_result(batch.run())
+    """
+
+    def __init__(self):
+        self.helper = PrivilegedHelper()
+        self.report = None
+
+    def run(self) -> dict:
+        if self.report is None:
+            self.report = self.helper.run()
+        return self.report
+
+
+def wayland_result(report: dict):
+    """ new wayland state from a helper report (no re-probe), None if the change failed """
+    results = [result for result in report.get("results", []) if result["op"] == "set-wayland"] or [{}]
+    if report.get("error") or not results[-1].get("ok"):
+        print(f"Can't change wayland: {report.get('error') or results[-1].get('error')}")
+        return None
+    state = results[-1]["state"]["wayland"] and not nvidia_present()
+    state_cache.set("wayland", state_cache.token("wayland"), state)
+    state_cache.save()
+    return state
+
+
+def set_wayland_state(enabled: bool):
+    """ change GDM flag with the root helper, return new state (no re-probe) or None if failed """
+    return wayland_result(PrivilegedHelper().set_wayland(enabled).run())
+
+def enable_wayland() -> bool:
+    return set_wayland_state(True) is not None
+
+def disable_wayland() -> bool:
+    return set_wayland_state(False) is not None
+
+def get_wayland_state():
+    return read_wayland(Path("/")) and not nvidia_present()
+
+def toggle_wayland():
+    return set_wayland_state(not get_wayland_state()) is not None
+
+def enable_firefox_theme():
+    subprocess.run('curl -s -o- https://raw.githubusercontent.com/rafaelmardojai/firefox-gnome-theme/master/scripts/install-by-curl.sh | bash', shell=True)
+
+def disable_firefox_theme():
+    firefox_profiles.remove_theme()
+
+def get_firefox_theme_state():
+    return firefox_profiles.has_theme()
+
+def toggle_firefox_theme():
+    if get_firefox_theme_state():
+        disable_firefox_theme()
+    else:
+        enable_firefox_theme()
+
+def plan_packages(layout_id: str = "", branding=None, extra=()) -> PackagePlan:
+    """
+    every package change of a setup, run later in one transaction
+
+    Args:
+        layout_id (str): install missing packages of this layout
+        branding (bool): install (True) or remove (False) branding, None for no change
+        extra (list): packages of optional extensions
+    """
+
+    plan = PackagePlan()
+    if layout_id:
+        layout = load_layouts()[layout_id]
+        if extension_inventory.missing(layout.extensions):
+            plan.add_install(layout.packages)
+    if branding is not None:
+        arguments = [asset] if isinstance(asset, str) else asset
+        if branding:
+            plan.add_install(arguments)
+        else:
+            plan.add_remove(arguments)
+    plan.add_install(extra)
+    return plan
+
+
+def packages_result(plan: PackagePlan, report: dict) -> tuple:
+    """ return true if all packages of plan are ok after the helper batch AND error message """
+    results = plan.results(report)
+    for name, result in results.items():
+        print(f"{result['action']} {name}: {'ok' if result['ok'] else 'failed'}")
+    failed = [name for name, result in results.items() if not result["ok"]]
+    if failed:
+        return False, f"Failed packages: {' '.join(failed)}"
+    return True, ""
+
+
+def run_packages(plan: PackagePlan) -> tuple:
+    """ run plan in root helper, return true if all packages are ok AND error message """
+    helper = plan.queue(PrivilegedHelper())
+    if "--dev" in sys.argv:
+        print("Debug mode on:")
+        print("Simulating package operations:")
+        print(helper.operations)
+        return True, ""
+    return packages_result(plan, helper.run())
+
+
+def get_extensions(chosen_layout):
+    plan = plan_packages(chosen_layout)
+    if not plan.is_empty():
+        print(f"Needed packages: {' '.join(plan.install)}")
+        run_packages(plan)
+
+
+# ----------------- branding functions --------------------------
+def do_branding(remove: bool) -> tuple:
+    return run_packages(plan_packages(branding=not remove))
+
+
+def get_asset_state() -> bool:
+    arguments = [asset] if isinstance(asset, str) else asset
+    return not package_index.missing(arguments)
+# ----------------- end branding functions ----------------------
@@ -0,0 +1,131 @@
+import atexit
+import functools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+
+class Span:
+    """ timed span, added to tracer at exit """
+
+    def __init__(self, tracer, name: str, category: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, etype, evalue, traceback):
+        end = time.perf_counter_ns()
+        if etype:
+            self.args["error"] = str(evalue)
+        self.tracer.add(self.name, self.category, self.start, end, self.args)
+
+
+class Tracer:
+    """
+    collect timed spans of process spawns, probes and renders
+
+    disabled by default, span() cost nothing; enabled by "--trace out.json",
+    spans are written at exit in Chrome trace-event format (chrome://tracing, perfetto)
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.origin = time.perf_counter_ns()
+        self.lock = threading.Lock()
+        self.threads = {}
+
+    def span(self, name: str, category: str = "app", **args):
+        if not self.enabled:
+            return nullcontext()
+        return Span(self, name, category, args)
+
+    def traced(self, category: str = "app", name: str = ""):
+        """ decorator, run function in a span """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name or function.__qualname__, category):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add(self, name: str, category: str, start: int, end: int, args: dict):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self.origin) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": args,
+        }
+        with self.lock:
+            self.events.append(event)
+            self.threads[thread.ident] = thread.name
+
+    def enable(self, file_name: str):
+        """ start tracing, wrap process spawns and write file at exit """
+        if self.enabled:
+            return
+        self.enabled = True
+        # subprocess.run() and check_output() create a Popen, one span by process
+        subprocess.Popen.__init__ = self.wrap_spawn(subprocess.Popen.__init__, "subprocess.Popen", skip_self=True)
+        try:
+            import gi
+            gi.require_version("GLib", "2.0")
+            from gi.repository import GLib
+            GLib.spawn_command_line_sync = self.wrap_spawn(GLib.spawn_command_line_sync, "GLib.spawn_command_line_sync")
+        except (ImportError, ValueError):
+            pass
+        atexit.register(self.write, file_name)
+
+    def wrap_spawn(self, function, label: str, skip_self: bool = False):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            command = args[1 if skip_self else 0] if len(args) > skip_self else kwargs.get("args", "")
+            if not isinstance(command, str):
+                command = " ".join(str(arg) for arg in command)
+            with self.span(command[:120], "spawn", function=label, command=command):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def enable_from_argv(self, argv: list):
+        """ remove "--trace FILE" or "--trace=FILE" from argv and enable tracing """
+        for index, arg in enumerate(argv):
+            if arg == "--trace" and index + 1 < len(argv):
+                file_name = argv[index + 1]
+                del argv[index:index + 2]
+            elif arg.startswith("--trace="):
+                file_name = arg.split("=", 1)[1]
+                del argv[index]
+            else:
+                continue
+            self.enable(file_name)
+            return file_name
+        return None
+
+    def write(self, file_name: str):
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        events += [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": ident, "args": {"name": name}}
+                   for ident, name in threads.items()]
+        with open(file_name, "wt") as fwrite:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fwrite)
+        print(f"Trace written in {file_name}", file=sys.stderr)
+
+
+tracer = Tracer()
@@ -0,0 +1,72 @@
+import gi
+
+gi.require_version("Gio", "2.0")
+from gi.repository import Gio, GLib
+
+# file events arrive in bursts (pacman transaction, atomic rename), one callback per burst (ms)
+FILE_EVENTS_DELAY = 250
+
+
+class ChangeWatcher:
+    """
+    call back when watched settings, D-Bus signals or files change, without polling
+
+    callbacks run in the GTK main loop
+    """
+
+    def __init__(self):
+        self.monitors = []  # keep Gio.FileMonitor alive
+        self.handlers = []  # (object, handler id)
+        self.subscriptions = []  # (connection, subscription id)
+        self.pending = {}  # callback -> timeout source id
+
+    def watch_settings(self, settings: Gio.Settings, key: str, callback):
+        """ callback() when key changes """
+        handler_id = settings.connect(f"changed::{key}", lambda _settings, _key: callback())
+        self.handlers.append((settings, handler_id))
+
+    def watch_signal(self, bus_name: str, object_path: str, interface: str, signal: str, callback):
+        """ callback(*signal arguments) for a session bus signal, bus is connected asynchronously """
+        def on_bus(_source, result):
+            try:
+                connection = Gio.bus_get_finish(result)
+            except GLib.Error as err:
+                print(f"Can't watch {signal}: {err.message}")
+                return
+            subscription = connection.signal_subscribe(
+                bus_name, interface, signal, object_path, None, Gio.DBusSignalFlags.NONE,
+                lambda _connection, _sender, _path, _interface, _signal, parameters: callback(*parameters.unpack()))
+            self.subscriptions.append((connection, subscription))
+        Gio.bus_get(Gio.BusType.SESSION, None, on_bus)
+
+    def watch_files(self, paths, callback):
+        """ callback() after changes of files or directories, existing or not """
+        for path in paths:
+            try:
+                monitor = Gio.File.new_for_path(str(path)).monitor(Gio.FileMonitorFlags.WATCH_MOVES, None)
+            except GLib.Error as err:
+                print(f"Can't watch {path}: {err.message}")
+                continue
+            monitor.connect("changed", self.on_file_changed, callback)
+            self.monitors.append(monitor)
+
+    def on_file_changed(self, _monitor, _file, _other, event, callback):
+        if event == Gio.FileMonitorEvent.ATTRIBUTE_CHANGED or callback in self.pending:
+            return
+        self.pending[callback] = GLib.timeout_add(FILE_EVENTS_DELAY, self.on_files_settled, callback)
+
+    def on_files_settled(self, callback):
+        del self.pending[callback]
+        callback()
+        return GLib.SOURCE_REMOVE
+
+    def close(self):
+        for monitor in self.monitors:
+            monitor.cancel()
+        for obj, handler_id in self.handlers:
+            obj.disconnect(handler_id)
+        for connection, subscription in self.subscriptions:
+            connection.signal_unsubscribe(subscription)
+        for source_id in self.pending.values():
+            GLib.source_remove(source_id)
+        self.monitors, self.handlers, self.subscriptions, self.pending = [], [], [], {}
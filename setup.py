@@ -33,6 +33,12 @@ setup(
             'data/pictures/material_shellpreview.svg',
             'data/pictures/traditionalpreview.svg',
          ]),
+        ('share/gls/layouts',[
+            'data/layouts/gnome.ini',
+            'data/layouts/manjaro.ini',
+            'data/layouts/material_shell.ini',
+            'data/layouts/traditional.ini',
+         ]),
         ('share/gls/schemas',[
             'data/schemas/traditional_layout',
          ]),